@@ -0,0 +1,53 @@
+"""Helpers for conditional requests (ETag, If-None-Match and If-Match)."""
+import hashlib
+
+from flask import abort, make_response, request
+from flask_restful import abort as restful_abort
+
+
+def version_etag(version):
+    """Get the ETag of a resource from its version number."""
+    return f'v{version}'
+
+
+def list_etag(resources, *extra):
+    """Get the ETag of a list of resources from their ids and versions."""
+    digest = hashlib.sha1()
+    for resource in resources:
+        digest.update(f'{resource.id}:{resource.version};'.encode('utf-8'))
+    for value in extra:
+        digest.update(f'{value};'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def etag_headers(etag):
+    return {'ETag': f'"{etag}"'}
+
+
+def abort_if_not_modified(etag):
+    """Answer with a 304 if the client already has this version of the resource.
+
+    ETags are compared weakly, so that the weak ETag of a compressed response
+    matches too.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        abort(response)
+
+
+def get_if_match_version():
+    """Get the version the client expects to change, from the If-Match header.
+
+    Returns
+    -------
+    Optional[int]
+        None when there is no If-Match header, or it is `*`.
+    """
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    for etag in if_match.as_set():
+        if etag.startswith('v') and etag[1:].isdigit():
+            return int(etag[1:])
+    restful_abort(412, message='If-Match does not match any version of this resource.')
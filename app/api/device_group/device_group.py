@@ -1,27 +1,41 @@
-import boto3
 import logging
 from flask import Blueprint, request, jsonify
-from flask_restful import Api, Resource, abort, marshal_with, fields
+from flask_restful import Api, Resource, abort, fields
 from app.managers.device_group import (
     DeviceGroup,
     DeviceGroupUser,
+    FaceIndexResult,
     is_member,
     is_owner,
     get_device_group,
     delete_device_group,
     update_device_group,
     get_device_groups_by_user,
+    get_device_groups_by_user_page,
     create_device_group,
     get_user_in_device_group,
     delete_user_in_device_group,
     update_user_in_device_group,
     get_users_in_device_group,
+    get_users_in_device_group_page,
     add_user_to_device_group,
     register_user_face_in_device_group,
     auth_user_in_device_group,
+    auth_users_in_device_group,
     get_open_id_token,
     remove_user_face_from_device_group
 )
+from app.managers.device_group import membership
+from app.api.conditional import (
+    abort_if_not_modified,
+    etag_headers,
+    get_if_match_version,
+    list_etag,
+    version_etag
+)
+from app.api.serializers import compile_fields, serialize_with
+from app.api.throttling import admission_controlled
+from app.api.uploads import get_images
 
 
 errors = {
@@ -45,6 +59,34 @@ errors = {
         'message': 'Could not find a user with that face in a device group with that groupId.',
         'status': 404,
     },
+    'VersionMismatchException': {
+        'message': 'The resource has changed since it was read, read it again.',
+        'status': 412,
+    },
+    'InvalidCursorException': {
+        'message': 'The cursor is not valid, start again from the first page.',
+        'status': 400,
+    },
+    'InvalidImageException': {
+        'message': 'The image must be a JPEG or PNG within the size limit.',
+        'status': 400,
+    },
+    'DeadlineExceededException': {
+        'message': 'The request took too long, try again.',
+        'status': 504,
+    },
+    'ReadTimeoutError': {
+        'message': 'A backing service took too long to respond, try again.',
+        'status': 504,
+    },
+    'ConnectTimeoutError': {
+        'message': 'A backing service is unavailable, try again.',
+        'status': 503,
+    },
+    'EndpointConnectionError': {
+        'message': 'A backing service is unavailable, try again.',
+        'status': 503,
+    },
 }
 
 
@@ -52,10 +94,38 @@ bp = Blueprint('groups', __name__)
 api = Api(bp, errors=errors)
 
 
+@bp.before_request
+def begin_membership_scope():
+    membership.begin_request()
+
+
+@bp.teardown_request
+def end_membership_scope(exc):
+    membership.end_request()
+
+
 def get_cognito_user_id():
     return request.environ['event']['requestContext']['identity']['cognitoIdentityId']
 
 
+def get_page_args(max_limit=100):
+    """Get the `limit` and `cursor` query parameters of a paginated listing."""
+    limit = request.args.get('limit', None)
+    cursor = request.args.get('cursor', None)
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= max_limit:
+            abort(400, message=f'limit must be between 1 and {max_limit}.')
+    return limit, cursor
+
+
+def page_headers(next_cursor):
+    return {'X-Next-Cursor': next_cursor} if next_cursor else {}
+
+
 def abort_if_user_not_member_of_group(group_id):
     user_id = get_cognito_user_id()
     if not is_member(user_id, group_id):
@@ -80,49 +150,65 @@ device_group_user_fields = {
     'faceNum': fields.Integer(attribute='face_num')
 }
 
+face_index_result_fields = {
+    'status': fields.String,
+    'faceId': fields.String(attribute='face_id'),
+    'error': fields.String
+}
+serialize_face_index_results = compile_fields(face_index_result_fields)
+
 
 class DeviceGroupApi(Resource):
     # Get a group - if user is a member (also PUT, DELETE)
     # GET /api/groups/:id
-    @marshal_with(device_group_fields)
+    @serialize_with(device_group_fields)
     def get(self, group_id):
         abort_if_user_not_member_of_group(group_id)
         group = get_device_group(group_id)
-        return group
+        etag = version_etag(group.version)
+        abort_if_not_modified(etag)
+        return group, 200, etag_headers(etag)
 
     def delete(self, group_id):
         abort_if_user_not_owner_of_group(group_id)
-        delete_device_group(group_id)
+        if not delete_device_group(group_id):
+            # The group is gone, its users and faces are still being cleaned up.
+            return '', 202
         return '', 204
 
-    @marshal_with(device_group_fields)
+    # Update a group - honours If-Match for optimistic concurrency
+    # PUT /api/groups/:id
+    @serialize_with(device_group_fields)
     def put(self, group_id):
         abort_if_user_not_owner_of_group(group_id)
+        expected_version = get_if_match_version()
         data = request.get_json()
-        group = DeviceGroup(group_id, data['name'])
-        update_device_group(group)
-        return group, 201
+        group = update_device_group(DeviceGroup(group_id, data['name']), expected_version)
+        return group, 201, etag_headers(version_etag(group.version))
 
 
 class DeviceGroupListApi(Resource):
     # Get list of groups - for which user is a member
-    # GET /api/groups
-    @marshal_with(device_group_fields)
+    # GET /api/groups?limit=&cursor= (the next cursor is in X-Next-Cursor)
+    @serialize_with(device_group_fields)
     def get(self):
         owner = request.args.get('owner', False)
+        limit, cursor = get_page_args()
         user_id = get_cognito_user_id()
-        groups = get_device_groups_by_user(user_id, owner)
-        return groups
+        if limit is None and cursor is None:
+            groups, next_cursor = get_device_groups_by_user(user_id, owner), None
+        else:
+            groups, next_cursor = get_device_groups_by_user_page(user_id, owner, limit, cursor)
+        etag = list_etag(groups, next_cursor)
+        abort_if_not_modified(etag)
+        return groups, 200, dict(page_headers(next_cursor), **etag_headers(etag))
 
     # Create group - return new group and link (join user as owner)
     # POST /api/groups
-    @marshal_with(device_group_fields)
+    @serialize_with(device_group_fields)
     def post(self):
         data = request.get_json()
-        group = create_device_group(data['name'])
-        user_id = get_cognito_user_id()
-        add_user_to_device_group(user_id, group.id, owner=True)
-        return group, 201
+        return create_device_group(data['name'], owner_id=get_cognito_user_id()), 201
 
 
 api.add_resource(DeviceGroupApi, '/groups/<group_id>')
@@ -132,17 +218,19 @@ api.add_resource(DeviceGroupListApi, '/groups')
 class DeviceGroupUserApi(Resource):
     # Get a user - check permission (also PUT, DELETE)
     # GET /api/groups/:id/users/:id
-    @marshal_with(device_group_user_fields)
+    @serialize_with(device_group_user_fields)
     def get(self, group_id, user_id):
         cognito_user_id = get_cognito_user_id()
-        if user_id != cognito_user_id and not is_owner(cognito_user_id):
+        if user_id != cognito_user_id and not is_owner(cognito_user_id, group_id):
             abort(403, message='User does not have permission to make changes to that user.')
         user = get_user_in_device_group(user_id, group_id)
-        return user
+        etag = version_etag(user.version)
+        abort_if_not_modified(etag)
+        return user, 200, etag_headers(etag)
 
     def delete(self, group_id, user_id):
         cognito_user_id = get_cognito_user_id()
-        if user_id != cognito_user_id and not is_owner(cognito_user_id):
+        if user_id != cognito_user_id and not is_owner(cognito_user_id, group_id):
             abort(403, message='User does not have permission to make changes to that user.')
         delete_user_in_device_group(user_id, group_id)
         return '', 204
@@ -150,15 +238,19 @@ class DeviceGroupUserApi(Resource):
 
 class DeviceGroupUserListApi(Resource):
     # Get a list of users - check permission
-    # GET /api/groups/:id/users/
+    # GET /api/groups/:id/users/?limit=&cursor= (the next cursor is in X-Next-Cursor)
+    @serialize_with(device_group_user_fields)
     def get(self, group_id):
         abort_if_user_not_owner_of_group(group_id)
-        users = get_users_in_device_group(group_id)
-        return users
+        limit, cursor = get_page_args()
+        if limit is None and cursor is None:
+            return get_users_in_device_group(group_id)
+        users, next_cursor = get_users_in_device_group_page(group_id, limit, cursor)
+        return users, 200, page_headers(next_cursor)
 
     # Add/join user to a group - return new user entry and link
     # POST /api/groups/:id/users
-    @marshal_with(device_group_user_fields)
+    @serialize_with(device_group_user_fields)
     def post(self, group_id):
         """Join a group/add a user to a device group
         """
@@ -178,34 +270,49 @@ api.add_resource(DeviceGroupUserListApi, '/groups/<group_id>/users')
 
 class DeviceGroupUserFacesApi(Resource):
 
+    # Register faces, as JSON, multipart files or one raw image
+    # POST /api/groups/:id/users/:id/faces
+    @admission_controlled
     def post(self, group_id, user_id):
-        data = request.get_json()
-        faces = data['faces']
-        provider = data['provider']
-        token = data['token']
-        face_num = register_user_face_in_device_group(user_id, group_id, faces, provider, token)
+        faces, fields = get_images('faces')
+        provider = fields.get('provider')
+        token = fields.get('token')
+        if not provider or not token:
+            abort(400, message='A provider and a token are required.')
+        results = register_user_face_in_device_group(user_id, group_id, faces, provider, token,
+                                                     device_id=get_cognito_user_id())
+        face_num = sum(1 for result in results if result.status == FaceIndexResult.INDEXED)
         if face_num < 3:
-            abort(403, message='There are no faces in the image. Should be at least 1.')
-        return '', 201
+            abort(403, message='There are no faces in the image. Should be at least 1.',
+                  faces=serialize_face_index_results(results))
+        return {'faces': serialize_face_index_results(results)}, 201
 
     def delete(self, group_id, user_id):
         cognito_user_id = get_cognito_user_id()
-        if user_id != cognito_user_id and not is_owner(cognito_user_id):
+        if user_id != cognito_user_id and not is_owner(cognito_user_id, group_id):
             abort(403, message='User does not have permission to make changes to that user.')
 
-        remove_user_face_from_device_group(user_id, group_id)
-        return '', 204
+        removed = remove_user_face_from_device_group(user_id, group_id)
+        return {'removed': removed}, 200
 
 
 api.add_resource(DeviceGroupUserFacesApi, '/groups/<group_id>/users/<user_id>/faces')
 
 
 class DeviceGroupAuthApi(Resource):
-
+    # Authenticate by face, or every recognised face with ?multi=true
+    # POST /api/groups/:id/auth
+    @admission_controlled
     def post(self, group_id):
-        data = request.get_json()
-        face = data['face']
-        token, identity_id = auth_user_in_device_group(group_id, face)
+        faces, _ = get_images('face')
+        face = faces[0]
+        if request.args.get('multi', '').lower() in ('1', 'true'):
+            users = auth_users_in_device_group(group_id, face, device_id=get_cognito_user_id())
+            return {'users': [
+                {'userId': user_id, 'token': token, 'identityId': identity_id}
+                for user_id, token, identity_id in users
+            ]}, 201
+        token, identity_id = auth_user_in_device_group(group_id, face, device_id=get_cognito_user_id())
         return {'token': token, 'identityId': identity_id}, 201
 
 
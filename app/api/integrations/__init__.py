@@ -0,0 +1 @@
+from .integrations import bp as integrations_bp
@@ -1,9 +1,15 @@
 import logging
 from flask import Blueprint, request, jsonify
-from flask_restful import Api, Resource, abort, marshal_with, fields
+from flask_restful import Api, Resource, abort, fields
+from app.api.conditional import abort_if_not_modified, etag_headers
+from app.api.serializers import compile_fields, serialize_with
+from app.managers.cache import TTLCache
+from app.managers.device_group import is_member
 from app.managers.integrations import (
     Integration,
-    get_integrations
+    get_integrations,
+    get_integrations_catalog,
+    get_dashboard
 )
 
 
@@ -11,7 +17,23 @@ errors = {
     'IntegrationNotFoundException': {
         'message': 'An integration with that integrationId does not exist.',
         'status': 404,
-    }
+    },
+    'DeadlineExceededException': {
+        'message': 'The request took too long, try again.',
+        'status': 504,
+    },
+    'ReadTimeoutError': {
+        'message': 'A backing service took too long to respond, try again.',
+        'status': 504,
+    },
+    'ConnectTimeoutError': {
+        'message': 'A backing service is unavailable, try again.',
+        'status': 503,
+    },
+    'EndpointConnectionError': {
+        'message': 'A backing service is unavailable, try again.',
+        'status': 503,
+    },
 }
 
 
@@ -31,17 +53,51 @@ device_group_user_integrations_fields = {
 }
 
 integrations_fields = {
-    'integrationId': fields.String(attribute='integration_id'),
-    'functionName': fields.Integer(attribute='function_name')
+    'integrationId': fields.String(attribute='id'),
+    'name': fields.String,
+    'functionName': fields.String(attribute='function_name')
 }
+serialize_integrations = compile_fields(integrations_fields)
 
+# The marshalled catalog, keyed by its version, only the latest is kept.
+_marshalled_catalog = TTLCache(maxsize=1)
 
-class IntegrationListApi(Resource):
 
-    @marshal_with(integrations_fields)
+class IntegrationListApi(Resource):
+    # Get the available integrations, answers If-None-Match with a 304
+    # GET /api/integrations
     def get(self):
-        integrations = get_integrations()
-        return integrations
+        catalog = get_integrations_catalog()
+        abort_if_not_modified(catalog.version)
+        headers = etag_headers(catalog.version)
+
+        marshalled = _marshalled_catalog.get(catalog.version)
+        if marshalled is None:
+            marshalled = serialize_integrations(catalog.integrations)
+            _marshalled_catalog.set(catalog.version, marshalled)
+        return marshalled, 200, headers
 
 
 api.add_resource(IntegrationListApi, '/integrations')
+
+
+widget_fields = {
+    'integrationId': fields.String(attribute='integration_id'),
+    'position': fields.Integer,
+    'status': fields.String,
+    'data': fields.Raw
+}
+
+
+class DashboardApi(Resource):
+    # Render the widgets of the user in a group, within a deadline
+    # GET /api/groups/:id/dashboard
+    @serialize_with(widget_fields, envelope='widgets')
+    def get(self, group_id):
+        user_id = get_cognito_user_id()
+        if not is_member(user_id, group_id):
+            abort(403, message='User is not a member of that device group')
+        return get_dashboard(user_id, group_id)
+
+
+api.add_resource(DashboardApi, '/groups/<group_id>/dashboard')
@@ -0,0 +1,117 @@
+"""Response serializers compiled from Flask-RESTful field specs.
+
+`marshal` walks the field dict for every object, instantiates field classes,
+looks values up through `get_value` and builds an `OrderedDict`. For list
+endpoints that is a noticeable part of the request. `compile_fields` turns a
+field spec into a function, generated once, that reads each attribute and
+formats it inline, with the same output as `marshal`.
+
+Only the plain fields (`String`, `Integer`, `Boolean` and `Raw`, reading a
+simple attribute) are inlined, anything else, and objects that are indexable
+without being mappings, go through Flask-RESTful as before.
+"""
+from collections import OrderedDict
+from collections.abc import Mapping
+from functools import wraps
+
+from flask_restful import fields as restful_fields, marshal, unpack
+
+# value -> expression, formatting as the field does.
+_FORMATS = {
+    restful_fields.String: "{default} if {value} is None else str({value})",
+    restful_fields.Integer: "{default} if {value} is None else int({value})",
+    restful_fields.Boolean: "{default} if {value} is None else bool({value})",
+    restful_fields.Raw: "{default} if {value} is None else {value}",
+}
+_MISSING = object()
+
+
+def _field(field):
+    return field() if isinstance(field, type) else field
+
+
+def _inlined(key, field):
+    attribute = key if field.attribute is None else field.attribute
+    return type(field) in _FORMATS and isinstance(attribute, str) and '.' not in attribute
+
+
+def _encoder_source(spec, namespace):
+    objects, mappings, items = [], [], []
+    for index, (key, field) in enumerate(spec.items()):
+        value = f"v{index}"
+        if isinstance(field, dict):
+            namespace[f"_f{index}"] = field
+            objects.append(f"    {value} = _marshal(obj, _f{index})")
+            mappings.append(objects[-1])
+        else:
+            field = _field(field)
+            namespace[f"_f{index}"] = field
+            if _inlined(key, field):
+                attribute = key if field.attribute is None else field.attribute
+                namespace[f"_d{index}"] = field.default
+                objects.append(f"    {value} = getattr(obj, {attribute!r}, None)")
+                mappings.append(f"    {value} = get({attribute!r}, _missing)\n"
+                                f"    if {value} is _missing:\n"
+                                f"        {value} = getattr(obj, {attribute!r}, None)")
+                value = _FORMATS[type(field)].format(value=value, default=f"_d{index}")
+            else:
+                objects.append(f"    {value} = _f{index}.output({key!r}, obj)")
+                mappings.append(objects[-1])
+        items.append(f"{key!r}: {value}")
+    result = "    return {" + ", ".join(items) + "}"
+    return "\n".join(
+        ["def encode(obj):",
+         "    if not hasattr(type(obj), '__getitem__'):"]
+        + ["    " + line for line in "\n".join(objects + [result]).split("\n")]
+        + ["    if not isinstance(obj, _Mapping):",
+           "        return _marshal(obj, _spec)",
+           "    get = obj.get"]
+        + mappings + [result])
+
+
+def compile_fields(spec, envelope=None):
+    """Compile a field spec into a function that serializes like `marshal`.
+
+    Parameters
+    ----------
+    spec: Dict[str, Union[fields.Raw, type, dict]]
+        The fields to output, as given to `marshal`.
+    envelope: str, optional
+        The key the output is wrapped in.
+
+    Returns
+    -------
+    Callable[[Any], Union[dict, list]]
+        Serializes an object, or a list or tuple of them.
+    """
+    namespace = {'_marshal': marshal, '_Mapping': Mapping, '_missing': _MISSING, '_spec': spec}
+    exec(_encoder_source(spec, namespace), namespace)
+    encode = namespace['encode']
+
+    def serialize(data):
+        if isinstance(data, (list, tuple)):
+            output = [encode(item) for item in data]
+        else:
+            output = encode(data)
+        return OrderedDict([(envelope, output)]) if envelope else output
+
+    serialize.encode = encode
+    return serialize
+
+
+class serialize_with:
+    """A `marshal_with` that serializes with a compiled field spec."""
+
+    def __init__(self, spec, envelope=None):
+        self.serialize = compile_fields(spec, envelope)
+
+    def __call__(self, function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            response = function(*args, **kwargs)
+            if isinstance(response, tuple):
+                data, code, headers = unpack(response)
+                return self.serialize(data), code, headers
+            return self.serialize(response)
+
+        return wrapper
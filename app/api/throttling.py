@@ -0,0 +1,33 @@
+"""Turning away requests refused by admission control."""
+import functools
+
+from werkzeug.exceptions import TooManyRequests
+
+from app.managers.device_group import AdmissionRejectedException
+
+
+class RetryLater(TooManyRequests):
+    """A 429 that tells the client when to retry with `Retry-After`."""
+
+    def __init__(self, description=None, retry_after=None):
+        super().__init__(description)
+        self.retry_after = retry_after
+
+    def get_headers(self, *args, **kwargs):
+        headers = super().get_headers(*args, **kwargs)
+        if self.retry_after is not None:
+            headers.append(('Retry-After', str(self.retry_after)))
+        return headers
+
+
+def admission_controlled(function):
+    """Answer with a 429 when the wrapped method is refused admission."""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        except AdmissionRejectedException as e:
+            raise RetryLater(str(e), retry_after=e.retry_after) from e
+
+    return wrapper
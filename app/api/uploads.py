@@ -0,0 +1,61 @@
+"""Helpers for endpoints that receive images.
+
+Images can be sent as the raw body (`application/octet-stream`), as files of
+a `multipart/form-data` body or, for older mirrors, base64 encoded in a JSON
+body. Raw and multipart images reach the managers as bytes, without a base64
+round trip. The other fields of a raw body are sent as headers, so that
+credentials stay out of the URL and its access logs.
+"""
+import os
+
+from flask import request
+from flask_restful import abort
+
+BINARY = 'application/octet-stream'
+MULTIPART = 'multipart/form-data'
+# API Gateway does not accept bodies larger than 10MB.
+MAX_UPLOAD_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
+# field: header, the fields a raw body can come with.
+HEADER_FIELDS = {'provider': 'X-Login-Provider', 'token': 'X-Login-Token'}
+
+
+def abort_if_too_large():
+    """Answer with a 413 from the Content-Length, before the body is read."""
+    length = request.content_length
+    if length is not None and length > MAX_UPLOAD_BYTES:
+        abort(413, message=f'The request body is larger than {MAX_UPLOAD_BYTES} bytes.')
+
+
+def get_images(name):
+    """Get the images, and the other fields, sent to an endpoint.
+
+    Parameters
+    ----------
+    name: str
+        The JSON key or the multipart field of the images. A JSON value may
+        be a single image or a list of them.
+
+    Returns
+    -------
+    Tuple[List[Union[bytes, str]], Mapping[str, str]]
+        The images, as bytes or base64 strings, and the other fields: the
+        form of a multipart body, the JSON object, or the `HEADER_FIELDS`
+        headers of a raw body.
+    """
+    abort_if_too_large()
+    if request.mimetype == BINARY:
+        images = [request.get_data(cache=False)]
+        fields = {field: request.headers[header] for field, header in HEADER_FIELDS.items()
+                  if header in request.headers}
+    elif request.mimetype == MULTIPART:
+        images, fields = [upload.read() for upload in request.files.getlist(name)], request.form
+    else:
+        fields = request.get_json(force=True, silent=True) or {}
+        if not isinstance(fields, dict):
+            abort(400, message='The request body must be a JSON object.')
+        images = fields.get(name) or []
+        if not isinstance(images, list):
+            images = [images]
+    if not images or not all(images):
+        abort(400, message=f'The request has no {name}.')
+    return images, fields
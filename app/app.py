@@ -2,16 +2,43 @@ import os
 from flask import Flask
 from flask import request, jsonify
 
+from app import compression
 from app.api.device_group import device_group_bp
+from app.api.integrations import integrations_bp
+from app.api.uploads import MAX_UPLOAD_BYTES
+from app.managers import deadline, tracing
 
 
 app = Flask(__name__)
+# Multipart bodies are refused while they are parsed, not once buffered.
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 app.register_blueprint(device_group_bp, url_prefix='/api')
+app.register_blueprint(integrations_bp, url_prefix='/api')
+
+
+@app.before_request
+def start_request():
+    deadline.start(request.environ.get('context'))
+    tracing.start()
+
+
+@app.teardown_request
+def end_request(exc):
+    deadline.clear()
+    tracing.finish()
 
 
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,If-None-Match,If-Match,X-Login-Provider,X-Login-Token')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    response.headers.add('Access-Control-Expose-Headers', 'ETag,X-Next-Cursor,Retry-After')
+    compression.compress(request, response)
+    trace = tracing.current()
+    if trace is not None:
+        response.headers['Server-Timing'] = trace.server_timing()
+        response.headers.add('Timing-Allow-Origin', '*')
+        route = request.url_rule.rule if request.url_rule else request.path
+        tracing.emit(trace, route, request.method, response.status_code)
     return response
@@ -0,0 +1,90 @@
+"""Gzip compression of responses.
+
+Large JSON bodies (group and member lists, the integrations catalog) are
+compressed when the client accepts gzip. Small bodies, where the gzip header
+and the CPU time outweigh the bytes saved, and bodies without content (304,
+204) are sent as they are.
+
+Compressed responses carry `Content-Encoding`, which makes serverless-wsgi
+hand the body to API Gateway base64 encoded. API Gateway only decodes it for
+the client when the first type of its `Accept` header is one of the
+`binaryMediaTypes`, given to the app as `BINARY_MEDIA_TYPES`, so behind API
+Gateway only those requests are compressed. Without `BINARY_MEDIA_TYPES`,
+e.g. when served locally, every client that accepts gzip is.
+
+The gzip representation is not byte for byte the identity one, so its ETag
+is made weak, and so is that of a 304 answering the weak ETag.
+"""
+import gzip
+import os
+import time
+
+from app.managers import tracing
+
+ENABLED = os.environ.get('RESPONSE_COMPRESSION', 'true').lower() not in ('0', 'false', 'no')
+MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+LEVEL = int(os.environ.get('COMPRESSION_LEVEL', 6))
+COMPRESSIBLE = ('application/json', 'text/')
+BINARY_MEDIA_TYPES = frozenset(
+    media_type.strip() for media_type in os.environ.get('BINARY_MEDIA_TYPES', '').split(',')
+    if media_type.strip())
+
+
+def _decoded_by_gateway(request):
+    if not BINARY_MEDIA_TYPES:
+        return True
+    accept = request.headers.get('Accept', '').split(',')[0].split(';')[0].strip()
+    return accept in BINARY_MEDIA_TYPES
+
+
+def _compressible(request, response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers:
+        return False
+    if not response.mimetype.startswith(COMPRESSIBLE):
+        return False
+    return request.accept_encodings['gzip'] > 0 and _decoded_by_gateway(request)
+
+
+def _weaken_etag(response):
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def compress(request, response):
+    """Gzip `response` in place when it is worth it and the client accepts it.
+
+    The sizes before and after, and the ratio, are recorded in the trace of
+    the request.
+    """
+    if not ENABLED:
+        return response
+    response.vary.add('Accept-Encoding')
+    if BINARY_MEDIA_TYPES:
+        response.vary.add('Accept')
+    if response.status_code == 304:
+        etag, _ = response.get_etag()
+        if etag and request.if_none_match.is_weak(etag):
+            _weaken_etag(response)
+    if not _compressible(request, response):
+        return response
+    data = response.get_data()
+    if len(data) < MIN_BYTES:
+        return response
+
+    started = time.perf_counter()
+    compressed = gzip.compress(data, compresslevel=LEVEL)
+    duration = time.perf_counter() - started
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = 'gzip'
+    _weaken_etag(response)
+
+    trace = tracing.current()
+    if trace is not None:
+        trace.measure('ResponseBytes', len(data), 'Bytes')
+        trace.measure('CompressedBytes', len(compressed), 'Bytes')
+        trace.measure('CompressionRatio', round(len(data) / len(compressed), 2))
+        trace.measure('CompressionTime', round(duration * 1000, 3), 'Milliseconds')
+    return response
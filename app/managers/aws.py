@@ -0,0 +1,215 @@
+"""A shared, lazy registry of AWS clients and resources.
+
+Nothing is created at import time: a client or resource is built the first
+time it is used, and reused for the life of the (warm) container. Managers
+hold `lazy_client`, `lazy_resource` and `lazy_table` proxies at module level
+so that their code reads as if the objects already existed.
+
+Every client is built in a few timeout tiers. Each call is made with the
+tier that fits the time left before the request deadline, and no attempt,
+first or retried, is started once the deadline has passed.
+"""
+import os
+import threading
+
+import boto3
+import botocore.session
+from botocore.config import Config
+
+from app.managers import deadline, tracing
+from app.managers.wire import RawResponseParserFactory
+
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', 20))
+
+# (minimum seconds left, connect timeout, read timeout, attempts), longest
+# first. Every attempt of a call timing out still fits in the time left:
+# (connect + read) * attempts <= minimum - deadline.SAFETY_MARGIN, with the
+# default margin. Below the last minimum, a call can overrun the deadline by
+# at most that margin. Backoff sleeps are not counted, but an attempt is not
+# started after them if the deadline has passed.
+TIERS = (
+    (20, 2, 4.5, 3),
+    (8, 1, 2.5, 2),
+    (3, 0.5, 2, 1),
+    (1, 0.2, 0.3, 1),
+)
+_configs = [
+    Config(connect_timeout=connect_timeout,
+           read_timeout=read_timeout,
+           retries={'total_max_attempts': attempts},
+           max_pool_connections=MAX_POOL_CONNECTIONS)
+    for _, connect_timeout, read_timeout, attempts in TIERS
+]
+
+_lock = threading.RLock()
+_session = None
+_raw_session = None
+_clients = {}
+_raw_clients = {}
+_resources = {}
+_tables = {}
+
+
+def get_session():
+    """Get the boto3 session every client and resource is created from."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _create_session(botocore.session.get_session())
+    return _session
+
+
+def get_raw_session():
+    """Get the boto3 session raw clients are created from."""
+    global _raw_session
+    if _raw_session is None:
+        with _lock:
+            if _raw_session is None:
+                core_session = botocore.session.get_session()
+                core_session.register_component('response_parser_factory', RawResponseParserFactory())
+                _raw_session = _create_session(core_session)
+    return _raw_session
+
+
+def _create_session(core_session):
+    session = boto3.session.Session(botocore_session=core_session)
+    # Sent before every attempt, where `before-call` is only sent once a call.
+    session.events.register('before-send', _check_deadline)
+    tracing.install(session)
+    return session
+
+
+def _check_deadline(event_name, **kwargs):
+    # before-send.<service>.<operation>
+    deadline.check(event_name.split('.', 1)[-1])
+
+
+def _tier():
+    left = deadline.remaining()
+    if left is None:
+        return 0
+    for tier, (minimum, _, _, _) in enumerate(TIERS):
+        if left >= minimum:
+            return tier
+    return len(TIERS) - 1
+
+
+def client(service_name):
+    """Get the shared client of an AWS service, creating it on first use.
+
+    The client's timeouts and retries fit the time left before the deadline.
+    """
+    key = (service_name, _tier())
+    try:
+        return _clients[key]
+    except KeyError:
+        pass
+    # Creating clients is not thread-safe, and is worth doing only once.
+    with _lock:
+        if key not in _clients:
+            _clients[key] = get_session().client(service_name, config=_configs[key[1]])
+        return _clients[key]
+
+
+def raw_client(service_name):
+    """Get the shared raw client of an AWS service, creating it on first use.
+
+    Successful responses are the JSON body as sent, without being walked
+    through the response shape, see `app.managers.wire`.
+    """
+    key = (service_name, _tier())
+    try:
+        return _raw_clients[key]
+    except KeyError:
+        pass
+    with _lock:
+        if key not in _raw_clients:
+            _raw_clients[key] = get_raw_session().client(service_name, config=_configs[key[1]])
+        return _raw_clients[key]
+
+
+def resource(service_name):
+    """Get the shared resource of an AWS service, creating it on first use.
+
+    The resource's timeouts and retries fit the time left before the deadline.
+    """
+    key = (service_name, _tier())
+    try:
+        return _resources[key]
+    except KeyError:
+        pass
+    with _lock:
+        if key not in _resources:
+            _resources[key] = get_session().resource(service_name, config=_configs[key[1]])
+        return _resources[key]
+
+
+def table(env_name):
+    """Get the DynamoDB table whose name is in the environment variable `env_name`."""
+    key = (env_name, _tier())
+    try:
+        return _tables[key]
+    except KeyError:
+        pass
+    with _lock:
+        if key not in _tables:
+            _tables[key] = resource('dynamodb').Table(os.environ[env_name])
+        return _tables[key]
+
+
+def reset():
+    """Forget every client, resource and table, e.g. after changing the session."""
+    global _session, _raw_session
+    with _lock:
+        _session = None
+        _raw_session = None
+        _clients.clear()
+        _raw_clients.clear()
+        _resources.clear()
+        _tables.clear()
+
+
+class _Lazy:
+    def __init__(self, factory, *args):
+        self._factory = factory
+        self._args = args
+
+    def __getattr__(self, name):
+        return getattr(self._factory(*self._args), name)
+
+    def __repr__(self):
+        return f"<lazy {self._factory.__name__}{self._args!r}>"
+
+
+class _LazyTable(_Lazy):
+    def __init__(self, env_name):
+        super().__init__(table, env_name)
+        self._env_name = env_name
+
+    # The name is known without creating the table resource.
+    @property
+    def name(self):
+        return os.environ[self._env_name]
+
+    table_name = name
+
+
+def lazy_client(service_name):
+    """A stand-in for `client(service_name)` that creates it on first use."""
+    return _Lazy(client, service_name)
+
+
+def lazy_raw_client(service_name):
+    """A stand-in for `raw_client(service_name)` that creates it on first use."""
+    return _Lazy(raw_client, service_name)
+
+
+def lazy_resource(service_name):
+    """A stand-in for `resource(service_name)` that creates it on first use."""
+    return _Lazy(resource, service_name)
+
+
+def lazy_table(env_name):
+    """A stand-in for `table(env_name)` that creates it on first use."""
+    return _LazyTable(env_name)
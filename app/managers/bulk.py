@@ -0,0 +1,201 @@
+"""Bulk DynamoDB reads and writes.
+
+`paginate` follows `LastEvaluatedKey` lazily, `batch_get` splits keys into
+request sized chunks that are fetched concurrently and retries any
+`UnprocessedKeys` with backoff, `batch_delete` does the same for deletes.
+Cursors hand a `LastEvaluatedKey` to API
+clients as an opaque string.
+"""
+import base64
+import binascii
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from app.managers import deadline
+from app.managers.retry import backoff_delays, call_with_backoff, sleep_before_retry
+
+BATCH_GET_LIMIT = 100
+BATCH_GET_WORKERS = 4
+BATCH_WRITE_LIMIT = 25
+BATCH_WRITE_WORKERS = 4
+MAX_ATTEMPTS = 8
+
+
+class InvalidCursorException(Exception):
+    pass
+
+
+class BulkOperationIncompleteException(Exception):
+    pass
+
+
+def paginate_pages(operation, **kwargs):
+    """Run a query or scan page by page.
+
+    Parameters
+    ----------
+    operation: Callable
+        `Table.query`, `Table.scan` or their client equivalents.
+    **kwargs
+        The arguments of the operation, an `ExclusiveStartKey` resumes a
+        previous pagination.
+
+    Yields
+    ------
+    Tuple[List[dict], Optional[dict]]
+        The items of each page and the `LastEvaluatedKey` following it.
+    """
+    while True:
+        response = call_with_backoff(operation, **kwargs)
+        last_evaluated_key = response.get('LastEvaluatedKey')
+        yield response.get('Items', []), last_evaluated_key
+        if not last_evaluated_key:
+            return
+        kwargs['ExclusiveStartKey'] = last_evaluated_key
+
+
+def paginate(operation, **kwargs):
+    """Run a query or scan, yielding every item of every page."""
+    for items, _ in paginate_pages(operation, **kwargs):
+        yield from items
+
+
+def chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _batch_get_chunk(batch_get_item, table_name, keys, options):
+    request_items = {table_name: dict(options, Keys=keys)}
+    items = []
+    for delay in backoff_delays(MAX_ATTEMPTS):
+        response = call_with_backoff(batch_get_item, RequestItems=request_items)
+        items.extend(response['Responses'].get(table_name, []))
+        request_items = response.get('UnprocessedKeys')
+        if not request_items:
+            return items
+        if not sleep_before_retry(delay):
+            break
+    raise BulkOperationIncompleteException(
+        f"{len(request_items[table_name]['Keys'])} keys of {table_name} were not read.")
+
+
+def batch_get(batch_get_item, table_name, keys, max_workers=BATCH_GET_WORKERS, **options):
+    """Get many items from one table, whatever the number of keys.
+
+    Parameters
+    ----------
+    batch_get_item: Callable
+        `batch_get_item` of the DynamoDB resource or client.
+    table_name: str
+        The name of the table.
+    keys: Iterable[dict]
+        The primary keys of the items, duplicates are fetched once.
+    max_workers: int, optional
+        The number of chunks fetched at once.
+    **options
+        Other arguments for the table, e.g. `ProjectionExpression`.
+
+    Returns
+    -------
+    List[dict]
+        The items that exist, in no particular order.
+
+    Raises
+    ------
+    BulkOperationIncompleteException
+        When some keys are still unprocessed after retrying.
+    """
+    unique = {json.dumps(key, sort_keys=True, default=str): key for key in keys}
+    key_chunks = list(chunks(unique.values(), BATCH_GET_LIMIT))
+    if not key_chunks:
+        return []
+    if len(key_chunks) == 1:
+        return _batch_get_chunk(batch_get_item, table_name, key_chunks[0], options)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(key_chunks))) as executor:
+        results = executor.map(
+            deadline.propagate(lambda chunk: _batch_get_chunk(batch_get_item, table_name, chunk, options)),
+            key_chunks)
+        return [item for items in results for item in items]
+
+
+def encode_cursor(last_evaluated_key):
+    """Turn a `LastEvaluatedKey` into an opaque cursor, or None at the end."""
+    if not last_evaluated_key:
+        return None
+    payload = json.dumps(last_evaluated_key, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Turn a cursor back into an `ExclusiveStartKey`, or None without one.
+
+    Raises
+    ------
+    InvalidCursorException
+    """
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (binascii.Error, UnicodeError, ValueError) as e:
+        raise InvalidCursorException(f"Cursor '{cursor}' is not valid.") from e
+    if not isinstance(key, dict) or not all(isinstance(v, str) for v in key.values()):
+        raise InvalidCursorException(f"Cursor '{cursor}' is not valid.")
+    return key
+
+
+def _batch_write_chunk(batch_write_item, table_name, requests):
+    request_items = {table_name: requests}
+    for delay in backoff_delays(MAX_ATTEMPTS):
+        response = call_with_backoff(batch_write_item, RequestItems=request_items)
+        request_items = response.get('UnprocessedItems')
+        if not request_items:
+            return len(requests)
+        if not sleep_before_retry(delay):
+            break
+    raise BulkOperationIncompleteException(
+        f"{len(request_items[table_name])} items of {table_name} were not written.")
+
+
+def batch_delete(batch_write_item, table_name, keys, max_workers=BATCH_WRITE_WORKERS):
+    """Delete many items from one table, chunks are deleted concurrently.
+
+    Parameters
+    ----------
+    batch_write_item: Callable
+        `batch_write_item` of the DynamoDB resource or client.
+    table_name: str
+        The name of the table.
+    keys: Iterable[dict]
+        The primary keys of the items, consumed lazily so it may be a generator.
+    max_workers: int, optional
+        The number of chunks deleted at once.
+
+    Returns
+    -------
+    int
+        The number of items deleted.
+
+    Raises
+    ------
+    BulkOperationIncompleteException
+        When some items are still unprocessed after retrying.
+    """
+    deleted = 0
+    write_chunk = deadline.propagate(_batch_write_chunk)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        chunk = []
+        for key in keys:
+            chunk.append({'DeleteRequest': {'Key': key}})
+            if len(chunk) == BATCH_WRITE_LIMIT:
+                futures.append(executor.submit(write_chunk, batch_write_item, table_name, chunk))
+                chunk = []
+        if chunk:
+            futures.append(executor.submit(write_chunk, batch_write_item, table_name, chunk))
+        for future in futures:
+            deleted += future.result()
+    return deleted
@@ -0,0 +1,82 @@
+"""Per-request deadlines.
+
+A request's deadline is taken from the remaining time of the Lambda context
+(less a safety margin), or from `REQUEST_BUDGET` seconds when run locally.
+AWS clients are configured with timeouts and retries that fit in the time
+left, and no AWS call is started once the deadline has passed.
+
+The deadline is thread-local, functions run on worker threads must be
+wrapped with `propagate` to see it (and to have their AWS calls traced).
+"""
+import os
+import threading
+import time
+
+from app.managers import tracing
+
+REQUEST_BUDGET = float(os.environ.get('REQUEST_BUDGET', 25))
+# Time kept back to turn a timeout into a response before Lambda is killed.
+SAFETY_MARGIN = float(os.environ.get('REQUEST_SAFETY_MARGIN', 0.5))
+
+_local = threading.local()
+
+
+class DeadlineExceededException(Exception):
+    pass
+
+
+def start(context=None, budget=None):
+    """Start the deadline of a request.
+
+    Parameters
+    ----------
+    context: LambdaContext, optional
+        The Lambda context, whose remaining time bounds the request.
+    budget: float, optional
+        Seconds the request may take, defaults to `REQUEST_BUDGET`.
+    """
+    budget = REQUEST_BUDGET if budget is None else budget
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        budget = min(budget, context.get_remaining_time_in_millis() / 1000)
+    _local.deadline = time.monotonic() + budget - SAFETY_MARGIN
+
+
+def clear():
+    _local.deadline = None
+
+
+def remaining():
+    """Get the seconds left before the deadline, or None without a deadline."""
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check(operation=None):
+    """Raise if the deadline has passed.
+
+    Raises
+    ------
+    DeadlineExceededException
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceededException(
+            f"The request deadline passed {-left:.2f}s before {operation or 'the call'}.")
+
+
+def propagate(function):
+    """Wrap `function` so that it runs under the current deadline and trace on any thread."""
+    deadline = getattr(_local, 'deadline', None)
+    function = tracing.propagate(function)
+
+    def run(*args, **kwargs):
+        previous = getattr(_local, 'deadline', None)
+        _local.deadline = deadline
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.deadline = previous
+
+    return run
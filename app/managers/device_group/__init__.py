@@ -1,26 +1,38 @@
 from .device_group_manager import (
     DeviceGroup,
     DeviceGroupUser,
+    FaceIndexResult,
     DeviceGroupNotFoundException,
     DeviceGroupAlreadyExistsException,
     UserNotInDeviceGroupException,
     UserAlreadyInDeviceGroupException,
     FaceNotInDeviceGroupException,
+    VersionMismatchException,
     NoFaceInImageException,
+    InvalidImageException,
     is_member,
     is_owner,
     get_device_group,
     delete_device_group,
     update_device_group,
     get_device_groups_by_user,
+    iter_device_groups_by_user,
+    get_device_groups_by_user_page,
     create_device_group,
     get_user_in_device_group,
     delete_user_in_device_group,
     update_user_in_device_group,
     get_users_in_device_group,
+    iter_users_in_device_group,
+    get_users_in_device_group_page,
     add_user_to_device_group,
     register_user_face_in_device_group,
     auth_user_in_device_group,
+    auth_users_in_device_group,
     get_open_id_token,
-    remove_user_face_from_device_group
+    remove_user_face_from_device_group,
+    count_user_faces_in_group,
+    adjust_user_face_count
 )
+from .admission import AdmissionRejectedException
+from app.managers.bulk import InvalidCursorException
@@ -0,0 +1,233 @@
+"""Admission control for the endpoints that call Rekognition.
+
+Rekognition's transactions per second are shared by the whole account, so a
+few mirrors authenticating in a loop can get every caller throttled. Before
+calling it, auth and face registration take tokens from two buckets, one for
+the device making the request and one for the device group, and are turned
+away with a `retry_after` when either is empty instead of queueing into
+throttling.
+
+The buckets use the generic cell rate algorithm, a token bucket kept as a
+single timestamp: the theoretical arrival time (TAT) of the next request.
+Each request moves the TAT forward by its cost, and is refused when that
+would take it further than `burst` requests ahead of now. A single timestamp
+can be updated atomically in DynamoDB, so the same limits can be shared by
+every container with `DynamoDBRateLimitStore`, or kept per container with
+`InMemoryRateLimitStore`, selected by `ADMISSION_STORE`.
+"""
+import abc
+import logging
+import math
+import os
+import threading
+import time
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from app.managers import aws, deadline
+from app.managers.cache import TTLCache
+from app.managers.retry import error_code
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('ADMISSION_CONTROL', 'true').lower() not in ('0', 'false', 'no')
+STORE = os.environ.get('ADMISSION_STORE', 'memory')
+
+dynamodb_client = aws.lazy_raw_client('dynamodb')
+
+# Seconds of float rounding forgiven, so that a bucket admits its whole burst.
+_ROUNDING = 1e-6
+
+
+class AdmissionRejectedException(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        # Seconds until the request would be admitted.
+        self.retry_after = retry_after
+
+
+class Budget:
+    """Requests per second allowed, with bursts of up to `burst` requests."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+
+    @property
+    def interval(self):
+        return 1.0 / self.rate
+
+    @property
+    def tolerance(self):
+        return self.burst * self.interval
+
+
+GROUP_BUDGET = Budget(float(os.environ.get('ADMISSION_GROUP_RATE', 5)),
+                      int(os.environ.get('ADMISSION_GROUP_BURST', 20)))
+DEVICE_BUDGET = Budget(float(os.environ.get('ADMISSION_DEVICE_RATE', 1)),
+                       int(os.environ.get('ADMISSION_DEVICE_BURST', 5)))
+
+
+class RateLimitStore(abc.ABC):
+    """The interface of the state of the buckets."""
+
+    @abc.abstractmethod
+    def acquire(self, key, budget, cost):
+        """Take `cost` tokens from the bucket `key`.
+
+        Returns
+        -------
+        float
+            0 if the tokens were taken, otherwise the seconds until they
+            would be, nothing is taken then.
+        """
+
+    @abc.abstractmethod
+    def release(self, key, budget, cost):
+        """Give back `cost` tokens taken from the bucket `key`."""
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    def __init__(self, maxsize=4096):
+        # An evicted or expired bucket is a full one.
+        self._tats = TTLCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def acquire(self, key, budget, cost):
+        with self._lock:
+            now = time.monotonic()
+            tat = max(self._tats.get(key, now), now) + cost * budget.interval
+            wait = tat - now - budget.tolerance
+            if wait > _ROUNDING:
+                return wait
+            self._tats.set(key, tat, ttl=tat - now)
+            return 0
+
+    def release(self, key, budget, cost):
+        with self._lock:
+            now = time.monotonic()
+            tat = self._tats.get(key, now) - cost * budget.interval
+            if tat > now:
+                self._tats.set(key, tat, ttl=tat - now)
+            else:
+                self._tats.pop(key, None)
+
+
+def _number(value):
+    return str(value) if isinstance(value, int) else f'{value:.6f}'
+
+
+class DynamoDBRateLimitStore(RateLimitStore):
+    """Buckets shared by every container, in the table `RATE_LIMIT_TABLE`.
+
+    An idle bucket is restarted with one conditional write, a busy one is
+    moved forward with a conditional atomic `ADD`. Items expire through the
+    table's TTL on `expiresAt`.
+    """
+
+    def __init__(self, table_name=None):
+        self.table_name = table_name or os.environ['RATE_LIMIT_TABLE']
+
+    def _update(self, key, update, condition, values):
+        try:
+            dynamodb_client.update_item(
+                TableName=self.table_name,
+                Key={'bucketKey': {'S': key}},
+                UpdateExpression=update,
+                ConditionExpression=condition,
+                ExpressionAttributeValues={name: {'N': _number(value)} for name, value in values.items()})
+            return True
+        except ClientError as e:
+            if error_code(e) != 'ConditionalCheckFailedException':
+                raise
+            return False
+
+    def acquire(self, key, budget, cost):
+        now = time.time()
+        increment = cost * budget.interval
+        expires_at = int(now + budget.tolerance) + 1
+        if self._update(key, "SET tat = :tat, expiresAt = :e",
+                        "attribute_not_exists(tat) OR tat <= :now",
+                        {':tat': now + increment, ':now': now, ':e': expires_at}):
+            return 0
+        if self._update(key, "ADD tat :i SET expiresAt = :e",
+                        "tat <= :limit",
+                        {':i': increment, ':limit': now + budget.tolerance - increment + _ROUNDING,
+                         ':e': expires_at}):
+            return 0
+        # The bucket is full, it has room again within one cost at most.
+        return increment
+
+    def release(self, key, budget, cost):
+        # A TAT moved into the past is an idle bucket to `acquire`.
+        self._update(key, "ADD tat :i", "attribute_exists(tat)", {':i': -cost * budget.interval})
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def set_store(store):
+    """Keep the buckets in `store`, a `RateLimitStore`."""
+    global _store
+    _store = store
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DynamoDBRateLimitStore() if STORE == 'dynamodb' else InMemoryRateLimitStore()
+        return _store
+
+
+def _acquire(key, budget, cost):
+    try:
+        return get_store().acquire(key, budget, min(cost, budget.burst))
+    except (ClientError, BotoCoreError, deadline.DeadlineExceededException):
+        # Losing the limiter must not take the endpoints down with it.
+        logger.warning("Could not check the bucket %s, admitting the request.", key, exc_info=True)
+        return 0
+
+
+def _release(key, budget, cost):
+    try:
+        get_store().release(key, budget, min(cost, budget.burst))
+    except (ClientError, BotoCoreError, deadline.DeadlineExceededException):
+        logger.warning("Could not give tokens back to the bucket %s.", key, exc_info=True)
+
+
+def admit(group_id, device_id=None, cost=1):
+    """Take tokens for `cost` Rekognition calls, or refuse the request.
+
+    The device is checked first, so that a noisy device does not use up the
+    budget of its group. When the group refuses, the tokens taken from the
+    device are given back, so a refused request costs nothing.
+
+    Parameters
+    ----------
+    group_id: str
+        The unique id of the group.
+    device_id: str, optional
+        The Cognito identity id of the caller.
+    cost: int
+        The number of Rekognition calls the request is about to make.
+
+    Raises
+    ------
+    AdmissionRejectedException
+    """
+    if not ENABLED:
+        return
+    buckets = [(f"group#{group_id}", GROUP_BUDGET, 'DeviceGroup', group_id)]
+    if device_id is not None:
+        buckets.insert(0, (f"device#{device_id}", DEVICE_BUDGET, 'Device', device_id))
+    taken = []
+    for key, budget, kind, id in buckets:
+        wait = _acquire(key, budget, cost)
+        if wait:
+            for taken_key, taken_budget in taken:
+                _release(taken_key, taken_budget, cost)
+            raise AdmissionRejectedException(
+                f"{kind}(id='{id}') is making too many requests.", math.ceil(wait))
+        taken.append((key, budget))
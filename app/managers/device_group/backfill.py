@@ -0,0 +1,108 @@
+"""One-off maintenance routines for the device group tables.
+
+Run with ``python -m app.managers.device_group.backfill [groupId ...]``.
+"""
+import logging
+import sys
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+from app.managers import bulk
+from app.managers.retry import error_code
+from . import membership
+from .device_group_manager import (
+    device_group_users_table,
+    count_user_faces_in_group,
+)
+
+logger = logging.getLogger(__name__)
+
+_PROJECTION = "groupId, userId, faceCount, version"
+
+
+def _device_group_users(group_ids=None):
+    if group_ids:
+        for group_id in group_ids:
+            yield from bulk.paginate(device_group_users_table.query,
+                                     KeyConditionExpression=Key('groupId').eq(group_id),
+                                     ProjectionExpression=_PROJECTION)
+    else:
+        yield from bulk.paginate(device_group_users_table.scan, ProjectionExpression=_PROJECTION)
+
+
+def _set_face_count(user_id, group_id, face_count, version):
+    # Only if no face was registered or removed since `version` was read, a
+    # face change bumps the version.
+    if version is None:
+        condition, values = "attribute_not_exists(version)", {}
+    else:
+        condition, values = "version = :v", {':v': version}
+    try:
+        device_group_users_table.update_item(
+            Key={'groupId': group_id,
+                 'userId': user_id},
+            UpdateExpression="set faceCount = :c add version :one",
+            ExpressionAttributeValues=dict(values, **{':c': face_count, ':one': 1}),
+            ConditionExpression="attribute_exists(userId) AND attribute_not_exists(faceCount) AND "
+                                + condition)
+        return True
+    except ClientError as e:
+        if error_code(e) != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+
+def _backfill_user(user_id, group_id, version):
+    """Count the faces of a user until they are recorded without a conflict.
+
+    Returns
+    -------
+    Optional[int]
+        The face count, or None if the user left or was backfilled meanwhile.
+    """
+    while True:
+        face_count = count_user_faces_in_group(user_id, group_id)
+        if _set_face_count(user_id, group_id, face_count, version):
+            return face_count
+        item = device_group_users_table.get_item(
+            Key={'groupId': group_id,
+                 'userId': user_id},
+            ConsistentRead=True,
+            ProjectionExpression=_PROJECTION).get('Item')
+        if item is None or 'faceCount' in item:
+            return None
+        version = item.get('version')
+
+
+def backfill_face_counts(group_ids=None):
+    """Set the `faceCount` attribute of the device group users that lack one.
+
+    Parameters
+    ----------
+    group_ids: List[str], optional
+        Only backfill the users in these groups, defaults to every group.
+
+    Returns
+    -------
+    int
+        The number of users updated.
+    """
+    updated = 0
+    for item in _device_group_users(group_ids):
+        if 'faceCount' in item:
+            continue
+        user_id, group_id = item['userId'], item['groupId']
+        face_count = _backfill_user(user_id, group_id, item.get('version'))
+        membership.invalidate_user(user_id, group_id)
+        if face_count is None:
+            continue
+        logger.info("User(id='%s') in DeviceGroup(id='%s') has %d faces.",
+                    user_id, group_id, face_count)
+        updated += 1
+    return updated
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    print(f"Backfilled {backfill_face_counts(sys.argv[1:] or None)} users.")
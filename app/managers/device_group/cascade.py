@@ -0,0 +1,106 @@
+"""Cascading delete of the rows that belong to a deleted device group.
+
+The members, faces and integration settings of a group are paged through by
+`groupId` and deleted in concurrent batches. Groups above
+`CASCADE_DELETE_THRESHOLD` rows are handed to the `cascade_delete_handler`
+function, invoked asynchronously, so that the HTTP request stays fast.
+"""
+import json
+import logging
+import os
+
+from boto3.dynamodb.conditions import Key
+
+from app.managers import aws, bulk
+from app.managers.integrations.integrations import device_group_user_integrations_table
+from .device_group_manager import (
+    dynamodb,
+    device_group_users_table,
+    device_group_user_faces_table,
+)
+
+logger = logging.getLogger(__name__)
+
+CASCADE_DELETE_THRESHOLD = int(os.environ.get('CASCADE_DELETE_THRESHOLD', 200))
+
+# (table, key attributes) of every table with rows keyed by groupId.
+_DEPENDENT_TABLES = (
+    (device_group_users_table, ('groupId', 'userId')),
+    (device_group_user_faces_table, ('groupId', 'faceId')),
+    (device_group_user_integrations_table, ('groupId', 'userId')),
+)
+
+
+def _keys(table, key_attributes, group_id):
+    return bulk.paginate(
+        table.query,
+        KeyConditionExpression=Key('groupId').eq(group_id),
+        ProjectionExpression=", ".join(key_attributes))
+
+
+def count_dependents(group_id, limit):
+    """Count the rows that belong to a device group, counting at most `limit` per table."""
+    return sum(
+        table.query(
+            KeyConditionExpression=Key('groupId').eq(group_id),
+            Select='COUNT',
+            Limit=limit)['Count']
+        for table, _ in _DEPENDENT_TABLES)
+
+
+def delete_dependents(group_id):
+    """Delete every row that belongs to a device group.
+
+    Parameters
+    ----------
+    group_id: str
+        The unique id of the group.
+
+    Returns
+    -------
+    int
+        The number of rows deleted.
+    """
+    deleted = 0
+    for table, key_attributes in _DEPENDENT_TABLES:
+        deleted += bulk.batch_delete(
+            dynamodb.batch_write_item, table.name, _keys(table, key_attributes, group_id))
+    logger.info("Deleted %d rows of DeviceGroup(id='%s').", deleted, group_id)
+    return deleted
+
+
+def schedule_delete_dependents(group_id):
+    """Delete the rows of a device group now, or in the background if there are many.
+
+    Parameters
+    ----------
+    group_id: str
+        The unique id of the group.
+
+    Returns
+    -------
+    bool
+        True if the rows were deleted, False if the delete was handed to the
+        background function, which it also is when deleting them now fails.
+    """
+    function_name = os.environ.get('CASCADE_DELETE_FUNCTION')
+    if not function_name or count_dependents(group_id, CASCADE_DELETE_THRESHOLD + 1) <= CASCADE_DELETE_THRESHOLD:
+        try:
+            delete_dependents(group_id)
+            return True
+        except Exception:
+            if not function_name:
+                raise
+            logger.exception("Could not delete the rows of DeviceGroup(id='%s') now, "
+                             "deleting them in the background.", group_id)
+
+    aws.client('lambda').invoke(
+        FunctionName=function_name,
+        InvocationType='Event',
+        Payload=json.dumps({'groupId': group_id}).encode('utf-8'))
+    return False
+
+
+def cascade_delete_handler(event, context):
+    """Lambda handler that deletes the rows of the device group in the event."""
+    return {'groupId': event['groupId'], 'deleted': delete_dependents(event['groupId'])}
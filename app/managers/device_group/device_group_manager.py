@@ -1,34 +1,94 @@
-import boto3
-import base64
+import logging
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from boto3.dynamodb.conditions import Key
-from botocore.exceptions import ClientError
-
-cognito_identity = boto3.client('cognito-identity')
-cognito_idp = boto3.client('cognito-idp')
-dynamodb = boto3.resource('dynamodb')
-rekognition = boto3.client('rekognition')
-
-device_group_table = dynamodb.Table(os.environ['DEVICE_GROUP_TABLE'])
-device_group_users_table = dynamodb.Table(
-    os.environ['DEVICE_GROUP_USERS_TABLE'])
-device_group_user_faces_table = dynamodb.Table(
-    os.environ['DEVICE_GROUP_USER_FACES_TABLE'])
-
-
-class DeviceGroup:
-    def __init__(self, id, name):
-        self.id = id
-        self.name = name
-
-
-class DeviceGroupUser:
-    def __init__(self, id, group_id, owner, face_num):
-        self.id = id
-        self.group_id = group_id
-        self.owner = owner
-        self.face_num = face_num
+from boto3.dynamodb.table import BatchWriter
+from botocore.exceptions import BotoCoreError, ClientError
+
+from app.managers import aws, bulk, deadline, wire
+from app.managers.models import Model
+from app.managers.retry import call_with_backoff, error_code
+from . import admission, face_index, membership, tokens
+from .images import InvalidImageException, crop_faces, normalise_image
+
+cognito_identity = aws.lazy_client('cognito-identity')
+dynamodb = aws.lazy_resource('dynamodb')
+# List endpoints read through the raw client, see `app.managers.wire`.
+dynamodb_client = aws.lazy_raw_client('dynamodb')
+rekognition = aws.lazy_client('rekognition')
+
+device_group_table = aws.lazy_table('DEVICE_GROUP_TABLE')
+device_group_users_table = aws.lazy_table('DEVICE_GROUP_USERS_TABLE')
+device_group_user_faces_table = aws.lazy_table('DEVICE_GROUP_USER_FACES_TABLE')
+
+FACE_INDEX_WORKERS = int(os.environ.get('FACE_INDEX_WORKERS', 4))
+FACE_SEARCH_WORKERS = int(os.environ.get('FACE_SEARCH_WORKERS', 4))
+FACE_MATCH_THRESHOLD = 95
+# The most FaceIds a single Rekognition DeleteFaces call accepts.
+DELETE_FACES_LIMIT = 4096
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceGroup(Model):
+    __slots__ = ('id', 'name', 'version')
+
+    def __init__(self, id, name, version=0):
+        self._set('id', id)
+        self._set('name', name)
+        # Bumped by every change, items written before versioning are 0.
+        self._set('version', version)
+
+
+class DeviceGroupUser(Model):
+    __slots__ = ('id', 'group_id', 'owner', 'version', '_face_num')
+
+    def __init__(self, id, group_id, owner, face_num, version=0):
+        self._set('id', id)
+        self._set('group_id', group_id)
+        self._set('owner', owner)
+        self._set('version', version)
+        # May be a callable, in which case it is only evaluated when read.
+        self._set('_face_num', face_num)
+
+    @property
+    def face_num(self):
+        if callable(self._face_num):
+            self._set('_face_num', self._face_num())
+        return self._face_num
+
+
+class FaceIndexResult(Model):
+    __slots__ = ('index', 'status', 'face_id', 'error')
+
+    INDEXED = 'indexed'
+    NO_FACE = 'no_face'
+    ERROR = 'error'
+
+    def __init__(self, index, status, face_id=None, error=None):
+        self._set('index', index)
+        self._set('status', status)
+        self._set('face_id', face_id)
+        self._set('error', error)
+
+
+_GROUP_ATTRIBUTES = (
+    ('groupId', wire.string, None),
+    ('groupName', wire.string, None),
+    ('version', wire.number, 0),
+)
+_decode_device_group = wire.decoder(DeviceGroup, _GROUP_ATTRIBUTES)
+
+# A missing faceCount is decoded as None, it has not been backfilled yet.
+_USER_ATTRIBUTES = (
+    ('userId', wire.string, None),
+    ('groupId', wire.string, None),
+    ('groupOwner', wire.boolean, False),
+    ('faceCount', wire.number, None),
+    ('version', wire.number, 0),
+)
+_decode_device_group_user = wire.decoder(DeviceGroupUser, _USER_ATTRIBUTES)
 
 
 class DeviceGroupNotFoundException(Exception):
@@ -47,6 +107,10 @@ class UserAlreadyInDeviceGroupException(Exception):
     pass
 
 
+class VersionMismatchException(Exception):
+    pass
+
+
 class FaceNotInDeviceGroupException(Exception):
     pass
 
@@ -73,6 +137,33 @@ def is_owner(user_id, group_id):
     return False
 
 
+def _load_device_group(group_id):
+    response = device_group_table.get_item(Key={'groupId': group_id})
+    if 'Item' not in response:
+        return membership.NOT_FOUND
+    item = response['Item']
+    return DeviceGroup(item['groupId'], item['groupName'], int(item.get('version', 0)))
+
+
+def _load_user_in_device_group(user_id, group_id):
+    response = device_group_users_table.get_item(
+        Key={
+            'groupId': group_id,
+            'userId': user_id
+        },
+        ProjectionExpression="groupId, userId, groupOwner, faceCount, version")
+    if 'Item' not in response:
+        return membership.NOT_FOUND
+    item = response['Item']
+    if 'faceCount' in item:
+        face_num = int(item['faceCount'])
+    else:
+        # Not yet backfilled, only count the faces if somebody asks.
+        face_num = lambda: count_user_faces_in_group(user_id, group_id)
+    return DeviceGroupUser(item['userId'], item['groupId'], item['groupOwner'], face_num,
+                           int(item.get('version', 0)))
+
+
 def get_device_group(group_id):
     """Get a device group by its id.
 
@@ -89,30 +180,40 @@ def get_device_group(group_id):
     ------
     DeviceGroupNotFoundException
     """
-    response = device_group_table.get_item(Key={'groupId': group_id})
-    if 'Item' not in response:
+    # Only remembered for the request, the group may be renamed elsewhere.
+    group = membership.lookup(('group', group_id),
+                              lambda: _load_device_group(group_id), shared=False)
+    if group is membership.NOT_FOUND:
         raise DeviceGroupNotFoundException(
             f"DeviceGroup(id='{group_id}') not found.")
-    item = response['Item']
-    return DeviceGroup(item['groupId'], item['groupName'])
+    return group
 
 
 def delete_device_group(group_id):
-    """Delete a device group by its id.
+    """Delete a device group by its id, along with its users, faces and integrations.
 
     Parameters
     ----------
     group_id: str
         The unique id of the group.
 
+    Returns
+    -------
+    bool
+        True if everything was deleted, False if the users, faces and
+        integrations of a large group are being deleted in the background.
+
     Raises
     ------
     DeviceGroupNotFoundException
     """
+    from .cascade import schedule_delete_dependents
+
     try:
-        device_group_table.delete_item(
+        group = device_group_table.delete_item(
             Key={'groupId': group_id},
-            ConditionExpression="attribute_exists(groupId)")
+            ConditionExpression="attribute_exists(groupId)",
+            ReturnValues='ALL_OLD')['Attributes']
     except ClientError as e:
         if hasattr(
                 e, 'response'
@@ -121,37 +222,108 @@ def delete_device_group(group_id):
                 f"DeviceGroup(id='{group_id}') not found.") from e
         else:
             raise
+    finally:
+        membership.invalidate_group(group_id)
+        face_index.invalidate(group_id)
+
+    try:
+        deleted = schedule_delete_dependents(group_id)
+    except Exception:
+        # The group is the only way to its rows, put it back so that deleting
+        # it can be retried.
+        _restore_device_group(group)
+        raise
+    # The rows are gone or going, the collection is no use without them.
+    _try_delete_face_collection(group_id)
+    return deleted
+
+
+def _restore_device_group(item):
+    try:
+        device_group_table.put_item(Item=item, ConditionExpression="attribute_not_exists(groupId)")
+    except Exception:
+        logger.exception("Could not restore DeviceGroup(id='%s'), its rows are orphaned.", item['groupId'])
+    membership.invalidate_group(item['groupId'])
+
 
-    delete_face_collection(group_id)
+def _version_condition(expected_version):
+    """Get the condition and values that only match `expected_version`."""
+    if expected_version is None:
+        return "", {}
+    if expected_version == 0:
+        return " AND attribute_not_exists(version)", {}
+    return " AND version = :expected", {':expected': expected_version}
 
 
-def update_device_group(device_group):
+def update_device_group(device_group, expected_version=None):
     """Update an existing device group.
 
     Parameters
     ----------
     device_group: DeviceGroup
         The device group to update.
+    expected_version: int, optional
+        Only update the device group if it is still at this version.
+
+    Returns
+    -------
+    DeviceGroup
+        The updated device group, with its new version.
 
     Raises
     ------
     DeviceGroupNotFoundException
+    VersionMismatchException
     """
+    condition, values = _version_condition(expected_version)
     try:
-        device_group_table.update_item(
+        response = device_group_table.update_item(
             Key={'groupId': device_group.id},
-            UpdateExpression="set groupName = :n",
-            ExpressionAttributeValues={':n': device_group.name},
-            ConditionExpression="attribute_exists(groupId)",
+            UpdateExpression="set groupName = :n add version :one",
+            ExpressionAttributeValues=dict(values, **{':n': device_group.name, ':one': 1}),
+            ConditionExpression="attribute_exists(groupId)" + condition,
             ReturnValues="UPDATED_NEW")
     except ClientError as e:
         if hasattr(
                 e, 'response'
         ) and e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            if expected_version is not None and _load_device_group(device_group.id) is not membership.NOT_FOUND:
+                raise VersionMismatchException(
+                    f"DeviceGroup(id='{device_group.id}') is not at version {expected_version}.") from e
             raise DeviceGroupNotFoundException(
                 f"DeviceGroup(id='{device_group.id}') not found.") from e
         else:
             raise
+    finally:
+        membership.invalidate_group(device_group.id)
+    return DeviceGroup(device_group.id, device_group.name, int(response['Attributes']['version']))
+
+
+def _query_device_group_memberships(user_id, owner, **kwargs):
+    values = {':u': {'S': user_id}}
+    kwargs.update(
+        TableName=device_group_users_table.name,
+        IndexName='useridGSI',
+        KeyConditionExpression="userId = :u",
+        ProjectionExpression="groupId, userId")
+    if owner:
+        kwargs['FilterExpression'] = "groupOwner = :o"
+        values[':o'] = {'BOOL': True}
+    kwargs['ExpressionAttributeValues'] = values
+    return bulk.paginate_pages(dynamodb_client.query, **kwargs)
+
+
+def _get_device_groups(group_ids):
+    groups = {
+        group.id: group
+        for group in map(_decode_device_group, bulk.batch_get(
+            dynamodb_client.batch_get_item,
+            device_group_table.table_name,
+            [{'groupId': {'S': group_id}} for group_id in group_ids],
+            ConsistentRead=True,
+            **wire.projection(_GROUP_ATTRIBUTES)))
+    }
+    return [groups[group_id] for group_id in group_ids if group_id in groups]
 
 
 def get_device_groups_by_user(user_id, owner=False):
@@ -169,40 +341,115 @@ def get_device_groups_by_user(user_id, owner=False):
     List[DeviceGroup]
         A list of device groups for which the user is a member of.
     """
-    response = device_group_users_table.query(
-        IndexName='useridGSI',
-        KeyConditionExpression=Key('userId').eq(user_id))
-    items = response['Items']
+    return list(iter_device_groups_by_user(user_id, owner))
 
-    if owner:
-        items = list(filter(lambda item: item['groupOwner'], items))
-
-    if not items:
-        return []
-
-    response = dynamodb.batch_get_item(
-        RequestItems={
-            device_group_table.table_name: {
-                'Keys': [{
-                    'groupId': item['groupId']
-                } for item in items],
-                'ConsistentRead': True
-            }
-        })
-    items = response['Responses'][device_group_table.table_name]
-    device_groups = [
-        DeviceGroup(item['groupId'], item['groupName']) for item in items
-    ]
-    return device_groups
+
+def iter_device_groups_by_user(user_id, owner=False):
+    """Stream the device groups for which a particular user is a member of.
+
+    Groups are fetched a page of memberships at a time.
+
+    Parameters
+    ----------
+    user_id: str
+        The unique id of the user.
+    owner: bool, optional
+        Return only the device groups where the user is the owner.
+
+    Yields
+    ------
+    DeviceGroup
+    """
+    for items, _ in _query_device_group_memberships(user_id, owner):
+        yield from _get_device_groups([item['groupId']['S'] for item in items])
+
+
+def get_device_groups_by_user_page(user_id, owner=False, limit=None, cursor=None):
+    """Get one page of the device groups for which a particular user is a member of.
+
+    Parameters
+    ----------
+    user_id: str
+        The unique id of the user.
+    owner: bool, optional
+        Return only the device groups where the user is the owner.
+    limit: int, optional
+        The maximum number of memberships read for the page.
+    cursor: str, optional
+        The cursor returned with the previous page.
+
+    Returns
+    -------
+    Tuple[List[DeviceGroup], Optional[str]]
+        The device groups and the cursor of the next page, None on the last page.
+
+    Raises
+    ------
+    InvalidCursorException
+    """
+    kwargs = {}
+    if limit:
+        kwargs['Limit'] = limit
+    exclusive_start_key = bulk.decode_cursor(cursor)
+    if exclusive_start_key:
+        kwargs['ExclusiveStartKey'] = wire.wire_key(exclusive_start_key)
+    items, last_evaluated_key = next(
+        _query_device_group_memberships(user_id, owner, **kwargs))
+    groups = _get_device_groups([item['groupId']['S'] for item in items])
+    return groups, bulk.encode_cursor(wire.string_key(last_evaluated_key))
+
+
+def _group_items(group_id, name, owner_id):
+    # Written with the raw client, so in the wire format.
+    items = [(device_group_table.name, {
+        'groupId': {'S': group_id},
+        'groupName': {'S': name},
+        'version': {'N': '1'},
+    })]
+    if owner_id is not None:
+        items.append((device_group_users_table.name, {
+            'groupId': {'S': group_id},
+            'userId': {'S': owner_id},
+            'groupOwner': {'BOOL': True},
+            'faceCount': {'N': '0'},
+            'version': {'N': '1'},
+        }))
+    return items
+
+
+def _rollback_device_group(group_id, items):
+    try:
+        dynamodb_client.transact_write_items(TransactItems=[
+            {'Delete': {'TableName': table_name,
+                        'Key': {name: item[name] for name in ('groupId', 'userId') if name in item}}}
+            for table_name, item in items
+        ])
+    except Exception:
+        logger.exception("Could not roll back DeviceGroup(id='%s').", group_id)
+    membership.invalidate_group(group_id)
 
 
-def create_device_group(name):
+def _try_delete_face_collection(group_id):
+    try:
+        delete_face_collection(group_id)
+    except Exception:
+        logger.exception("Could not delete the collection of DeviceGroup(id='%s').", group_id)
+
+
+def create_device_group(name, owner_id=None):
     """Creates a new device group with a random id.
 
+    The group, and the membership of its owner, are written in one
+    transaction while the face collection is created, so a group is never
+    left without an owner or a collection. If either fails, whatever the
+    error, the other is undone.
+
     Parameters
     ----------
     name: str
         The name of the group.
+    owner_id: str, optional
+        The unique id of the user that owns the group.
 
     Returns
     -------
@@ -213,24 +460,41 @@ def create_device_group(name):
     ------
     DeviceGroupAlreadyExistsException
     """
-
-    item = {'groupId': str(uuid.uuid1()), 'groupName': name}
-
-    try:
-        device_group_table.put_item(
-            Item=item, ConditionExpression="attribute_not_exists(groupId)")
-    except ClientError as e:
-        if hasattr(
-                e, 'response'
-        ) and e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+    group_id = str(uuid.uuid1())
+    items = _group_items(group_id, name, owner_id)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        collection = executor.submit(deadline.propagate(create_face_collection), group_id)
+        try:
+            dynamodb_client.transact_write_items(TransactItems=[
+                {'Put': {'TableName': table_name,
+                         'Item': item,
+                         'ConditionExpression': "attribute_not_exists(groupId)"}}
+                for table_name, item in items
+            ])
+            transaction_error = None
+        except Exception as e:
+            transaction_error = e
+        collection_error = collection.exception()
+
+    if transaction_error is not None:
+        if collection_error is None:
+            _try_delete_face_collection(group_id)
+        if not isinstance(transaction_error, ClientError):
+            # A timeout or a lost connection may hide a committed transaction.
+            _rollback_device_group(group_id, items)
+            raise transaction_error
+        reasons = transaction_error.response.get('CancellationReasons') or []
+        if error_code(transaction_error) == 'TransactionCanceledException' and any(
+                reason.get('Code') == 'ConditionalCheckFailed' for reason in reasons):
             raise DeviceGroupAlreadyExistsException(
-                f"DeviceGroup(id='{item['groupId']}') already exists.") from e
-        else:
-            raise
+                f"DeviceGroup(id='{group_id}') already exists.") from transaction_error
+        raise transaction_error
+    if collection_error is not None:
+        _rollback_device_group(group_id, items)
+        raise collection_error
 
-    create_face_collection(item['groupId'])
-
-    return DeviceGroup(item['groupId'], item['groupName'])
+    return DeviceGroup(group_id, name, 1)
 
 
 def get_user_in_device_group(user_id, group_id):
@@ -252,16 +516,13 @@ def get_user_in_device_group(user_id, group_id):
     ------
     UserNotInDeviceGroupException
     """
-    response = device_group_users_table.get_item(Key={
-        'groupId': group_id,
-        'userId': user_id
-    })
-    if 'Item' not in response:
+    user = membership.lookup(
+        ('user', group_id, user_id),
+        lambda: _load_user_in_device_group(user_id, group_id))
+    if user is membership.NOT_FOUND:
         raise UserNotInDeviceGroupException(
             f"User(id='{user_id}') not in DeviceGroup(id='{group_id}').")
-    item = response['Item']
-    face_num = len(get_user_face_ids_in_group(user_id, group_id))
-    return DeviceGroupUser(item['userId'], item['groupId'], item['groupOwner'], face_num)
+    return user
 
 
 def delete_user_in_device_group(user_id, group_id):
@@ -291,40 +552,97 @@ def delete_user_in_device_group(user_id, group_id):
                 f"User(id='{user_id}') not in DeviceGroup(id='{group_id}').")
         else:
             raise
+    finally:
+        membership.invalidate_user(user_id, group_id)
+        face_index.invalidate(group_id)
 
 
-def update_user_in_device_group(device_group_user):
+def update_user_in_device_group(device_group_user, expected_version=None):
     """Update an existing device group user.
 
     Parameters
     ----------
     device_group_user: DeviceGroupUser
         The device group user to update.
+    expected_version: int, optional
+        Only update the user if it is still at this version.
+
+    Returns
+    -------
+    int
+        The new version of the user.
 
     Raises
     ------
     UserNotInDeviceGroupException
+    VersionMismatchException
     """
+    condition, values = _version_condition(expected_version)
     try:
-        device_group_users_table.update_item(
+        response = device_group_users_table.update_item(
             Key={
                 'groupId': device_group_user.group_id,
                 'userId': device_group_user.id
             },
-            UpdateExpression="set groupOwner = :o",
-            ExpressionAttributeValues={':o': device_group_user.owner},
+            UpdateExpression="set groupOwner = :o add version :one",
+            ExpressionAttributeValues=dict(values, **{':o': device_group_user.owner, ':one': 1}),
             ConditionExpression=
-            "attribute_exists(groupId) AND attribute_exists(userId)",
+            "attribute_exists(groupId) AND attribute_exists(userId)" + condition,
             ReturnValues="UPDATED_NEW")
     except ClientError as e:
         if hasattr(
                 e, 'response'
         ) and e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            if expected_version is not None and _load_user_in_device_group(
+                    device_group_user.id, device_group_user.group_id) is not membership.NOT_FOUND:
+                raise VersionMismatchException(
+                    f"User(id='{device_group_user.id}') in DeviceGroup(id='{device_group_user.group_id}') "
+                    f"is not at version {expected_version}.") from e
             raise UserNotInDeviceGroupException(
                 f"User(id='{device_group_user.id}') not in DeviceGroup(id='{device_group_user.group_id}')."
             )
         else:
             raise
+    finally:
+        membership.invalidate_user(device_group_user.id, device_group_user.group_id)
+    return int(response['Attributes']['version'])
+
+
+def _query_users_in_device_group(group_id, **kwargs):
+    kwargs.update(
+        TableName=device_group_users_table.name,
+        KeyConditionExpression="groupId = :g",
+        ExpressionAttributeValues={':g': {'S': group_id}},
+        **wire.projection(_USER_ATTRIBUTES))
+    return bulk.paginate_pages(dynamodb_client.query, **kwargs)
+
+
+def _count_faces_by_user(group_id, first_user_id, last_user_id):
+    counts = {}
+    for item in bulk.paginate(
+            device_group_user_faces_table.query,
+            IndexName='groupIdUserIdGSI',
+            KeyConditionExpression=Key('groupId').eq(group_id) &
+            Key('userId').between(first_user_id, last_user_id),
+            ProjectionExpression="userId"):
+        counts[item['userId']] = counts.get(item['userId'], 0) + 1
+    return counts
+
+
+def _to_device_group_users(group_id, items):
+    users = [_decode_device_group_user(item) for item in items]
+    if all(user.face_num is not None for user in users):
+        return users
+    # Counters that have not been backfilled yet are worked out for the whole
+    # page at once, rather than with a query per user, only reading the faces
+    # of the range of users that need them.
+    user_ids = [user.id for user in users if user.face_num is None]
+    counts = _count_faces_by_user(group_id, min(user_ids), max(user_ids))
+    return [
+        user if user.face_num is not None else
+        DeviceGroupUser(user.id, user.group_id, user.owner, counts.get(user.id, 0), user.version)
+        for user in users
+    ]
 
 
 def get_users_in_device_group(group_id):
@@ -340,14 +658,55 @@ def get_users_in_device_group(group_id):
     List[DeviceGroupUser]
         A list of users in the device group.
     """
-    response = device_group_users_table.query(
-        KeyConditionExpression=Key('groupId').eq(group_id))
-    items = response['Items']
-    groups = [
-        DeviceGroupUser(item['userId'], item['groupId'], item['groupOwner'])
-        for item in items
-    ]
-    return groups
+    return list(iter_users_in_device_group(group_id))
+
+
+def iter_users_in_device_group(group_id):
+    """Stream the users in a particular device group, a page at a time.
+
+    Parameters
+    ----------
+    group_id: str
+        The unique id of the group.
+
+    Yields
+    ------
+    DeviceGroupUser
+    """
+    for items, _ in _query_users_in_device_group(group_id):
+        yield from _to_device_group_users(group_id, items)
+
+
+def get_users_in_device_group_page(group_id, limit=None, cursor=None):
+    """Get one page of the users in a particular device group.
+
+    Parameters
+    ----------
+    group_id: str
+        The unique id of the group.
+    limit: int, optional
+        The maximum number of users in the page.
+    cursor: str, optional
+        The cursor returned with the previous page.
+
+    Returns
+    -------
+    Tuple[List[DeviceGroupUser], Optional[str]]
+        The users and the cursor of the next page, None on the last page.
+
+    Raises
+    ------
+    InvalidCursorException
+    """
+    kwargs = {}
+    if limit:
+        kwargs['Limit'] = limit
+    exclusive_start_key = bulk.decode_cursor(cursor)
+    if exclusive_start_key:
+        kwargs['ExclusiveStartKey'] = wire.wire_key(exclusive_start_key)
+    items, last_evaluated_key = next(_query_users_in_device_group(group_id, **kwargs))
+    return (_to_device_group_users(group_id, items),
+            bulk.encode_cursor(wire.string_key(last_evaluated_key)))
 
 
 def add_user_to_device_group(user_id, group_id, owner=False):
@@ -378,6 +737,8 @@ def add_user_to_device_group(user_id, group_id, owner=False):
         'groupId': group_id,
         'userId': user_id,
         'groupOwner': owner,
+        'faceCount': 0,
+        'version': 1,
     }
 
     try:
@@ -390,85 +751,256 @@ def add_user_to_device_group(user_id, group_id, owner=False):
             raise UserAlreadyInDeviceGroupException(f"User(id='{user_id}') already in DeviceGroup(id='{group_id}').") from e
         else:
             raise
+    finally:
+        membership.invalidate_user(user_id, group_id)
 
-    return DeviceGroupUser(user_id, group_id, owner, 0)
+    return DeviceGroupUser(user_id, group_id, owner, 0, item['version'])
 
 
-def register_user_face_in_device_group(user_id, group_id, faces, provider, token):
-    face_ids = []
+def _index_face(index, user_id, group_id, face):
+    try:
+        image = normalise_image(face)
+    except InvalidImageException:
+        return FaceIndexResult(index, FaceIndexResult.ERROR, error='InvalidImageException')
 
-    for face in faces:
-        response = rekognition.index_faces(
+    try:
+        response = call_with_backoff(
+            rekognition.index_faces,
             CollectionId=group_id,
-            Image={'Bytes': base64.b64decode(face.encode('utf-8'))},
+            Image={'Bytes': image.data},
             ExternalImageId=user_id,
+            # Only the largest face of an image is recorded.
+            MaxFaces=1,
             DetectionAttributes=[
                 'DEFAULT'  # |'ALL',
             ])
+    except ClientError as e:
+        return FaceIndexResult(index, FaceIndexResult.ERROR, error=error_code(e))
+    except (BotoCoreError, deadline.DeadlineExceededException) as e:
+        # Timeouts and connection errors, the other images may still succeed.
+        return FaceIndexResult(index, FaceIndexResult.ERROR, error=type(e).__name__)
+    except Exception as e:
+        logger.exception("Could not index image %d of User(id='%s') in DeviceGroup(id='%s').",
+                         index, user_id, group_id)
+        return FaceIndexResult(index, FaceIndexResult.ERROR, error=type(e).__name__)
+
+    if not response.get('FaceRecords'):
+        return FaceIndexResult(index, FaceIndexResult.NO_FACE)
+    face_id = response['FaceRecords'][0]['Face']['FaceId']
+    return FaceIndexResult(index, FaceIndexResult.INDEXED, face_id=face_id)
+
+
+def register_user_face_in_device_group(user_id, group_id, faces, provider, token,
+                                       max_workers=None, device_id=None):
+    """Index the faces of a user into the face collection of a device group.
+
+    The images are indexed concurrently, throttled calls are retried with
+    backoff and a failure to index one image does not affect the others.
+    Face ids are written to the faces table as soon as they are indexed.
+
+    Parameters
+    ----------
+    user_id: str
+        The unique id of the user.
+    group_id: str
+        The unique id of the group.
+    faces: List[Union[str, bytes]]
+        The images, base64 encoded or raw, they are normalised before being indexed.
+    provider: str
+        The login provider of the user.
+    token: str
+        The login token of the user.
+    max_workers: int, optional
+        The maximum number of images indexed at once, 1 indexes them one at a time.
+    device_id: str, optional
+        The Cognito identity id of the caller, for admission control.
+
+    Returns
+    -------
+    List[FaceIndexResult]
+        A result for each image, in the order they were given.
 
-        if 'FaceRecords' in response:
-            face_id = response['FaceRecords'][0]['Face']['FaceId']
-            face_ids.append(face_id)
+    Raises
+    ------
+    AdmissionRejectedException
+    """
+    admission.admit(group_id, device_id, cost=len(faces))
+    results = [None] * len(faces)
+    workers = max(1, min(max_workers or FACE_INDEX_WORKERS, len(faces) or 1))
 
-    with device_group_user_faces_table.batch_writer() as batch:
-        for face_id in face_ids:
-            batch.put_item(Item={
-                'groupId': group_id,
-                'faceId': face_id,
-                'userId': user_id
-            })
+    written = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor, \
+                BatchWriter(device_group_user_faces_table.name,
+                            device_group_user_faces_table.meta.client,
+                            flush_amount=1) as batch:
+            futures = [
+                executor.submit(deadline.propagate(_index_face), index, user_id, group_id, face)
+                for index, face in enumerate(faces)
+            ]
+            try:
+                for future in as_completed(futures):
+                    result = future.result()
+                    results[result.index] = result
+                    if result.status == FaceIndexResult.INDEXED:
+                        batch.put_item(Item={
+                            'groupId': group_id,
+                            'faceId': result.face_id,
+                            'userId': user_id
+                        })
+                        written += 1
+            except BaseException:
+                # Images not indexed yet would never be written to the table.
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        # The counter and the index must follow the rows that were written.
+        if written:
+            face_index.invalidate(group_id)
+            adjust_user_face_count(user_id, group_id, written)
 
     get_open_id_token(user_id, provider, token)
 
-    return len(face_ids)
+    return results
 
 
-def get_user_face_ids_in_group(user_id, group_id):
-    response = device_group_user_faces_table.query(
+def count_user_faces_in_group(user_id, group_id):
+    """Count the faces registered by a user in a device group.
+
+    Parameters
+    ----------
+    user_id: str
+        The unique id of the user.
+    group_id: str
+        The unique id of the group.
+
+    Returns
+    -------
+    int
+        The number of faces, counted from the faces table.
+    """
+    return sum(1 for _ in bulk.paginate(
+        device_group_user_faces_table.query,
         IndexName='groupIdUserIdGSI',
-        KeyConditionExpression=Key('groupId').eq(group_id) & Key('userId').eq(user_id)
-    )
-    return response['Items']
+        KeyConditionExpression=Key('groupId').eq(group_id) & Key('userId').eq(user_id),
+        ProjectionExpression="faceId"))
+
 
+def adjust_user_face_count(user_id, group_id, delta):
+    """Atomically add `delta` to the face counter of a user in a device group.
 
-def auth_user_in_device_group(group_id, face):
+    Users whose counter has not been backfilled yet keep having their face
+    count worked out from the faces table until it is, only their version
+    is bumped, so that their ETag changes with their faces either way.
+
+    Parameters
+    ----------
+    user_id: str
+        The unique id of the user.
+    group_id: str
+        The unique id of the group.
+    delta: int
+        The number of faces added, negative when faces are removed.
+    """
+    try:
+        if delta and not _update_user_face_count(
+                user_id, group_id, "add faceCount :d, version :one",
+                {':d': delta, ':one': 1}, "attribute_exists(faceCount)"):
+            # Not backfilled yet, or no longer a member.
+            _update_user_face_count(
+                user_id, group_id, "add version :one",
+                {':one': 1}, "attribute_exists(userId)")
+    finally:
+        membership.invalidate_user(user_id, group_id)
+
+
+def _update_user_face_count(user_id, group_id, update, values, condition):
+    try:
+        device_group_users_table.update_item(
+            Key={'groupId': group_id,
+                 'userId': user_id},
+            UpdateExpression=update,
+            ExpressionAttributeValues=values,
+            ConditionExpression=condition)
+        return True
+    except ClientError as e:
+        if error_code(e) != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+
+def auth_user_in_device_group(group_id, face, device_id=None):
+    admission.admit(group_id, device_id)
     user_id = search_user_face_in_device_group(group_id, face)
-    response = cognito_identity.get_open_id_token_for_developer_identity(
-        IdentityPoolId=str(os.environ['IDENTITY_POOL_ID']),
-        Logins={
-            os.environ['DEVELOPER_PROVIDER_NAME']: user_id,
-        },
-        TokenDuration=86400
-    )
+    return _get_open_id_token({
+        os.environ['DEVELOPER_PROVIDER_NAME']: user_id,
+    })
 
-    identity_id = response['IdentityId']
-    token = response['Token']
 
-    return token, identity_id
+def auth_users_in_device_group(group_id, face, device_id=None):
+    """Authenticate every recognised user in an image.
+
+    Parameters
+    ----------
+    group_id: str
+        The unique id of the group.
+    face: Union[str, bytes]
+        An image, base64 encoded or raw, which may contain several faces.
+    device_id: str, optional
+        The Cognito identity id of the caller, for admission control.
+
+    Returns
+    -------
+    List[Tuple[str, str, str]]
+        The user id, token and identity id of each recognised user.
+
+    Raises
+    ------
+    AdmissionRejectedException
+    NoFaceInImageException
+    FaceNotInDeviceGroupException
+    """
+    user_ids = search_user_faces_in_device_group(group_id, face, device_id)
+    developer_provider_name = os.environ['DEVELOPER_PROVIDER_NAME']
+    return [
+        (user_id,) + _get_open_id_token({developer_provider_name: user_id})
+        for user_id in user_ids
+    ]
 
 
 def get_open_id_token(user_id, provider, token):
-    response = cognito_identity.get_open_id_token_for_developer_identity(
-        IdentityPoolId=str(os.environ['IDENTITY_POOL_ID']),
-        Logins={
-            os.environ['DEVELOPER_PROVIDER_NAME']: user_id,
-            provider: token
-        },
-        TokenDuration=86400
-    )
+    return _get_open_id_token({
+        os.environ['DEVELOPER_PROVIDER_NAME']: user_id,
+        provider: token
+    })
+
 
-    identity_id = response['IdentityId']
-    token = response['Token']
+def _get_open_id_token(logins):
+    """Get a (cached) Cognito OpenID token for the given logins.
 
-    return token, identity_id
+    Returns
+    -------
+    Tuple[str, str]
+        The token and the identity id.
+    """
+    identity_pool_id = str(os.environ['IDENTITY_POOL_ID'])
+    cached = tokens.get_token(
+        identity_pool_id, logins,
+        lambda: cognito_identity.get_open_id_token_for_developer_identity(
+            IdentityPoolId=identity_pool_id,
+            Logins=logins,
+            TokenDuration=tokens.TOKEN_DURATION))
+    return cached.token, cached.identity_id
 
 
 def search_user_face_in_device_group(group_id, face):
+    image = normalise_image(face)
     try:
         response = rekognition.search_faces_by_image(
             CollectionId=group_id,
-            FaceMatchThreshold=95,
-            Image={'Bytes': base64.b64decode(face.encode('utf-8'))},
+            FaceMatchThreshold=FACE_MATCH_THRESHOLD,
+            Image={'Bytes': image.data},
             MaxFaces=5,
         )
     except ClientError as e:
@@ -478,27 +1010,164 @@ def search_user_face_in_device_group(group_id, face):
             raise
 
     try:
-        face_id = response['FaceMatches'][0]['Face']['FaceId']
+        match = response['FaceMatches'][0]['Face']
     except IndexError:
         raise FaceNotInDeviceGroupException(
             f"DeviceGroup(id='{group_id}') does not recognise this face.")
 
-    response = device_group_user_faces_table.get_item(Key={
-        'groupId': group_id,
-        'faceId': face_id
-    })
-
-    if 'Item' not in response:
+    user_id = _get_user_id_by_face(group_id, match)
+    if user_id is None:
         raise FaceNotInDeviceGroupException(
             f"DeviceGroup(id='{group_id}') does not recognise this face.")
-    user_id = response['Item']['userId']
 
     return user_id
 
 
+def _search_face(group_id, image_bytes):
+    try:
+        response = call_with_backoff(
+            rekognition.search_faces_by_image,
+            CollectionId=group_id,
+            FaceMatchThreshold=FACE_MATCH_THRESHOLD,
+            Image={'Bytes': image_bytes},
+            MaxFaces=1,
+        )
+    except ClientError as e:
+        if error_code(e) == 'InvalidParameterException':
+            # Rekognition could not find the face in the crop.
+            return None
+        raise
+    matches = response['FaceMatches']
+    return matches[0]['Face'] if matches else None
+
+
+def _load_face_index(group_id):
+    return {
+        item['faceId']['S']: item['userId']['S'] for item in bulk.paginate(
+            dynamodb_client.query,
+            TableName=device_group_user_faces_table.name,
+            KeyConditionExpression="groupId = :g",
+            ExpressionAttributeValues={':g': {'S': group_id}},
+            ProjectionExpression="faceId, userId")
+    }
+
+
+def _load_face_user(group_id, face_id):
+    item = dynamodb_client.get_item(
+        TableName=device_group_user_faces_table.name,
+        Key={'groupId': {'S': group_id}, 'faceId': {'S': face_id}},
+        ProjectionExpression="userId").get('Item')
+    return item['userId']['S'] if item else None
+
+
+def _get_user_id_by_face(group_id, match):
+    # Warm containers resolve a match without reading the faces table.
+    face_id = match['FaceId']
+    return face_index.resolve(group_id, face_id,
+                              lambda: _load_face_index(group_id),
+                              lambda: _load_face_user(group_id, face_id))
+
+
+def search_user_faces_in_device_group(group_id, face, device_id=None):
+    """Find the users of a device group whose faces are in an image.
+
+    Every face in the image is searched for concurrently, unlike
+    `search_user_face_in_device_group` which only searches the largest face.
+    Without Pillow the faces cannot be cut out, so only the largest is searched.
+
+    Parameters
+    ----------
+    group_id: str
+        The unique id of the group.
+    face: Union[str, bytes]
+        An image, base64 encoded or raw.
+    device_id: str, optional
+        The Cognito identity id of the caller, for admission control.
+
+    Returns
+    -------
+    List[str]
+        The ids of the recognised users, largest face first, without duplicates.
+
+    Raises
+    ------
+    NoFaceInImageException
+    FaceNotInDeviceGroupException
+    """
+    admission.admit(group_id, device_id)
+    image = normalise_image(face)
+    response = rekognition.detect_faces(Image={'Bytes': image.data})
+    faces = sorted(
+        response['FaceDetails'],
+        key=lambda detail: detail['BoundingBox']['Width'] * detail['BoundingBox']['Height'],
+        reverse=True)
+    if not faces:
+        raise NoFaceInImageException(f"There are no faces in the image. Should be at least 1.")
+
+    try:
+        crops = crop_faces(image, [detail['BoundingBox'] for detail in faces])
+    except InvalidImageException:
+        crops = [image.data]
+    admission.admit(group_id, device_id, cost=len(crops))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(FACE_SEARCH_WORKERS, len(crops)))) as executor:
+        matches = [
+            match for match in executor.map(deadline.propagate(lambda crop: _search_face(group_id, crop)), crops)
+            if match is not None
+        ]
+    if not matches:
+        raise FaceNotInDeviceGroupException(
+            f"DeviceGroup(id='{group_id}') does not recognise these faces.")
+
+    user_ids = []
+    for match in matches:
+        user_id = _get_user_id_by_face(group_id, match)
+        if user_id is not None and user_id not in user_ids:
+            user_ids.append(user_id)
+    if not user_ids:
+        raise FaceNotInDeviceGroupException(
+            f"DeviceGroup(id='{group_id}') does not recognise these faces.")
+    return user_ids
+
+
 def remove_user_face_from_device_group(user_id, group_id):
-    # query DDB GSI for userId to get faceId, delete from collection/DDB
-    pass
+    """Remove every face a user registered in a device group.
+
+    The faces are removed from the face collection with as few DeleteFaces
+    calls as possible, and from the faces table in batches.
+
+    Parameters
+    ----------
+    user_id: str
+        The unique id of the user.
+    group_id: str
+        The unique id of the group.
+
+    Returns
+    -------
+    int
+        The number of faces removed.
+    """
+    face_ids = [
+        item['faceId'] for item in bulk.paginate(
+            device_group_user_faces_table.query,
+            IndexName='groupIdUserIdGSI',
+            KeyConditionExpression=Key('groupId').eq(group_id) & Key('userId').eq(user_id),
+            ProjectionExpression="faceId")
+    ]
+    if not face_ids:
+        return 0
+
+    for chunk in bulk.chunks(face_ids, DELETE_FACES_LIMIT):
+        call_with_backoff(rekognition.delete_faces, CollectionId=group_id, FaceIds=chunk)
+
+    removed = bulk.batch_delete(
+        dynamodb.batch_write_item,
+        device_group_user_faces_table.name,
+        ({'groupId': group_id, 'faceId': face_id} for face_id in face_ids))
+    face_index.invalidate(group_id)
+    adjust_user_face_count(user_id, group_id, -removed)
+    return removed
 
 
 def create_face_collection(group_id):
@@ -506,4 +1175,8 @@ def create_face_collection(group_id):
 
 
 def delete_face_collection(group_id):
-    rekognition.delete_collection(CollectionId=group_id)
+    try:
+        rekognition.delete_collection(CollectionId=group_id)
+    except ClientError as e:
+        if error_code(e) != 'ResourceNotFoundException':
+            raise
@@ -0,0 +1,100 @@
+"""A warm index of which user each face in a device group belongs to.
+
+Rekognition's matches are turned into user ids through an index of the
+group's faces, loaded from the faces table once and kept for as long as the
+container is warm (bounded by a TTL). A face that is missing from the index,
+e.g. registered by another container since, is looked up on its own and
+merged in, including when it is not in the table at all, so that an
+unrecorded face in the collection costs one lookup rather than one per auth.
+
+Each group has a version stamp, kept with its index and bumped whenever faces
+or users of the group change in this container. A load or lookup that raced
+with a bump is not cached. Faces removed by other containers are gone from
+the collection, so Rekognition never matches them.
+"""
+import itertools
+import os
+import threading
+
+from app.managers.cache import TTLCache
+
+# group id: (stamp, index or None), an index maps face ids to user ids, or
+# to None for faces that are not in the table.
+_groups = TTLCache(
+    maxsize=int(os.environ.get('FACE_INDEX_CACHE_SIZE', 256)),
+    ttl=float(os.environ.get('FACE_INDEX_TTL', 300)))
+_counter = itertools.count(1)
+_lock = threading.Lock()
+_stats = {'hits': 0, 'loads': 0, 'lookups': 0}
+
+
+def _count(counter):
+    with _lock:
+        _stats[counter] += 1
+
+
+def _entry(group_id):
+    return _groups.get(group_id) or (0, None)
+
+
+def _install(group_id, stamp, update):
+    with _lock:
+        current, index = _entry(group_id)
+        if current == stamp:
+            _groups.set(group_id, (stamp, update(index)))
+
+
+def resolve(group_id, face_id, load_index, load_face):
+    """Get the id of the user a matched face belongs to.
+
+    Parameters
+    ----------
+    group_id: str
+        The unique id of the group.
+    face_id: str
+        The `FaceId` of the match.
+    load_index: Callable[[], Dict[str, str]]
+        Loads the user id of every face of the group, by face id.
+    load_face: Callable[[], Optional[str]]
+        Loads the user id of the matched face, or None.
+
+    Returns
+    -------
+    Optional[str]
+        The user id, or None when the face is not in the faces table.
+    """
+    stamp, index = _entry(group_id)
+    if index is not None and face_id in index:
+        _count('hits')
+        return index[face_id]
+
+    if index is None:
+        _count('loads')
+        index = load_index()
+        _install(group_id, stamp, lambda current: index)
+        if face_id in index:
+            return index[face_id]
+
+    _count('lookups')
+    user_id = load_face()
+    _install(group_id, stamp,
+             lambda current: None if current is None else dict(current, **{face_id: user_id}))
+    return user_id
+
+
+def invalidate(group_id):
+    """Bump the version stamp of a group, dropping its index."""
+    with _lock:
+        _groups.set(group_id, (next(_counter), None))
+
+
+def get_stats():
+    """Get the hit, load and lookup counters, and the number of groups."""
+    with _lock:
+        stats = dict(_stats)
+    stats['size'] = len(_groups)
+    return stats
+
+
+def clear():
+    _groups.clear()
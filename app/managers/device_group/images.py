@@ -0,0 +1,230 @@
+"""Normalisation of client images before they are sent to Rekognition.
+
+Images are decoded once, validated and, when they are larger than needed for
+face detection, downscaled and recompressed to fit a byte budget. Pillow is
+optional, without it images that are within Rekognition's limits are passed
+through untouched.
+"""
+import base64
+import binascii
+import io
+import logging
+import os
+import threading
+import warnings
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Rekognition rejects raw image bytes above 5MB.
+REKOGNITION_MAX_BYTES = 5 * 1024 * 1024
+MAX_INPUT_BYTES = int(os.environ.get('IMAGE_MAX_INPUT_BYTES', 15 * 1024 * 1024))
+# Checked from the header, before a small file can be decoded into gigabytes.
+MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 25 * 1000 * 1000))
+MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', 1280))
+BYTE_BUDGET = int(os.environ.get('IMAGE_BYTE_BUDGET', 512 * 1024))
+JPEG_QUALITIES = (85, 75, 65, 50)
+
+JPEG = 'JPEG'
+PNG = 'PNG'
+_SIGNATURES = (
+    (b'\xff\xd8\xff', JPEG),
+    (b'\x89PNG\r\n\x1a\n', PNG),
+)
+
+_stats_lock = threading.Lock()
+_stats = {'images': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+
+class InvalidImageException(Exception):
+    pass
+
+
+class NormalisedImage:
+    def __init__(self, data, format, original_size):
+        self.data = data
+        self.format = format
+        self.original_size = original_size
+
+    @property
+    def bytes_saved(self):
+        return self.original_size - len(self.data)
+
+
+def decode_image(image):
+    """Decode a client image.
+
+    Parameters
+    ----------
+    image: Union[str, bytes]
+        A base64 encoded image, or the raw bytes of one.
+
+    Returns
+    -------
+    bytes
+
+    Raises
+    ------
+    InvalidImageException
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+    # Reject obviously oversized payloads before decoding them.
+    if len(image) * 3 // 4 > MAX_INPUT_BYTES:
+        raise InvalidImageException(f"The image is larger than {MAX_INPUT_BYTES} bytes.")
+    try:
+        return base64.b64decode(image.encode('utf-8'), validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise InvalidImageException("The image is not valid base64.") from e
+
+
+def detect_format(data):
+    for signature, format in _SIGNATURES:
+        if data.startswith(signature):
+            return format
+    return None
+
+
+def normalise_image(image, max_dimension=None, byte_budget=None):
+    """Decode, validate and shrink an image for Rekognition.
+
+    Parameters
+    ----------
+    image: Union[str, bytes]
+        A base64 encoded image, or the raw bytes of one.
+    max_dimension: int, optional
+        The largest width or height kept, defaults to `IMAGE_MAX_DIMENSION`.
+    byte_budget: int, optional
+        Images above this size are recompressed, defaults to `IMAGE_BYTE_BUDGET`.
+
+    Returns
+    -------
+    NormalisedImage
+
+    Raises
+    ------
+    InvalidImageException
+    """
+    max_dimension = max_dimension or MAX_DIMENSION
+    byte_budget = byte_budget or BYTE_BUDGET
+
+    data = decode_image(image)
+    original_size = len(data)
+    if original_size > MAX_INPUT_BYTES:
+        raise InvalidImageException(f"The image is larger than {MAX_INPUT_BYTES} bytes.")
+    format = detect_format(data)
+    if format is None:
+        raise InvalidImageException("The image must be a JPEG or PNG.")
+
+    if Image is not None:
+        data, format = _shrink(data, format, max_dimension, byte_budget)
+    if len(data) > REKOGNITION_MAX_BYTES:
+        raise InvalidImageException(
+            f"The image is larger than {REKOGNITION_MAX_BYTES} bytes.")
+
+    with _stats_lock:
+        _stats['images'] += 1
+        _stats['bytes_in'] += original_size
+        _stats['bytes_out'] += len(data)
+    normalised = NormalisedImage(data, format, original_size)
+    logger.debug("Normalised %s image from %d to %d bytes.",
+                 format, original_size, len(data))
+    return normalised
+
+
+def _shrink(data, format, max_dimension, byte_budget):
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            return _shrink_image(data, format, max_dimension, byte_budget)
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError,
+            Image.DecompressionBombWarning) as e:
+        raise InvalidImageException("The image could not be read.") from e
+
+
+def _shrink_image(data, format, max_dimension, byte_budget):
+    image = Image.open(io.BytesIO(data))
+    if image.width * image.height > MAX_PIXELS:
+        raise InvalidImageException(f"The image has more than {MAX_PIXELS} pixels.")
+    if max(image.size) <= max_dimension and len(data) <= byte_budget:
+        return data, format
+    # Let the JPEG decoder skip detail we are about to throw away.
+    image.draft('RGB', (max_dimension, max_dimension))
+    image = _apply_orientation(image)
+    image.thumbnail((max_dimension, max_dimension), Image.BILINEAR)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    for quality in JPEG_QUALITIES:
+        buffer = io.BytesIO()
+        image.save(buffer, JPEG, quality=quality, optimize=False)
+        if buffer.tell() <= byte_budget:
+            break
+    shrunk = buffer.getvalue()
+    if len(shrunk) >= len(data):
+        return data, format
+    return shrunk, JPEG
+
+
+def _apply_orientation(image):
+    # Re-encoding drops the EXIF data, so bake the orientation into the pixels.
+    exif_transpose = getattr(ImageOps, 'exif_transpose', None)
+    if exif_transpose is None:
+        return image
+    return exif_transpose(image)
+
+
+def crop_faces(image, bounding_boxes, margin=0.25):
+    """Cut each face out of an image so that it can be searched on its own.
+
+    Parameters
+    ----------
+    image: NormalisedImage
+        The image the faces were detected in.
+    bounding_boxes: List[dict]
+        Rekognition `BoundingBox`es, as ratios of the image size.
+    margin: float, optional
+        How much of the face size to keep around each face.
+
+    Returns
+    -------
+    List[bytes]
+        A JPEG for each face, in the order of `bounding_boxes`.
+
+    Raises
+    ------
+    InvalidImageException
+        When Pillow is not installed.
+    """
+    if Image is None:
+        raise InvalidImageException("Cropping faces requires Pillow.")
+    source = _apply_orientation(Image.open(io.BytesIO(image.data)))
+    if source.mode != 'RGB':
+        source = source.convert('RGB')
+    width, height = source.size
+
+    crops = []
+    for box in bounding_boxes:
+        left = box['Left'] - box['Width'] * margin
+        top = box['Top'] - box['Height'] * margin
+        right = box['Left'] + box['Width'] * (1 + margin)
+        bottom = box['Top'] + box['Height'] * (1 + margin)
+        face = source.crop((
+            max(0, int(left * width)), max(0, int(top * height)),
+            min(width, int(right * width)), min(height, int(bottom * height))))
+        buffer = io.BytesIO()
+        face.save(buffer, JPEG, quality=JPEG_QUALITIES[0])
+        crops.append(buffer.getvalue())
+    return crops
+
+
+def get_stats():
+    """Get the number of images normalised and the bytes saved by doing so."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['bytes_saved'] = stats['bytes_in'] - stats['bytes_out']
+    return stats
@@ -0,0 +1,116 @@
+"""Memoization of membership, ownership and device group lookups.
+
+Lookups are remembered for the duration of a request and, for membership and
+ownership, for a short TTL across invocations served by the same warm
+container. Device groups are only remembered per request: they are renamed
+by other containers too, and a stale name or version would be served, or a
+false 304 answered, until the TTL ran out. Any write that could change the
+answer must call one of the invalidate functions.
+"""
+import os
+import threading
+
+from app.managers.cache import TTLCache
+
+
+_shared = TTLCache(
+    maxsize=int(os.environ.get('MEMBERSHIP_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('MEMBERSHIP_CACHE_TTL', 30)))
+_request = threading.local()
+_stats_lock = threading.Lock()
+_stats = {'request_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+# Marks a lookup that was made and found nothing, so that it is cached too.
+NOT_FOUND = object()
+
+
+def begin_request():
+    """Start a fresh request scope."""
+    _request.memo = {}
+
+
+def end_request():
+    """Discard the request scope."""
+    _request.memo = None
+
+
+def _count(counter):
+    with _stats_lock:
+        _stats[counter] += 1
+
+
+def lookup(key, loader, shared=True):
+    """Resolve `key`, calling `loader` only when it is not cached.
+
+    Parameters
+    ----------
+    key: tuple
+        The cache key, its second element must be the group id.
+    loader: Callable[[], object]
+        Loads the value, may return `NOT_FOUND`.
+    shared: bool
+        Whether the value may be cached across invocations, otherwise it is
+        only remembered for the request.
+
+    Returns
+    -------
+    object
+        The cached or loaded value, or `NOT_FOUND`.
+    """
+    memo = getattr(_request, 'memo', None)
+    if memo is not None and key in memo:
+        _count('request_hits')
+        return memo[key]
+
+    value = _shared.get(key, None) if shared else None
+    if value is not None:
+        _count('shared_hits')
+    else:
+        _count('misses')
+        value = loader()
+        # Only positive answers outlive the request, so that a user who has
+        # just joined a group elsewhere is never turned away.
+        if shared and value is not NOT_FOUND:
+            _shared.set(key, value)
+
+    if memo is not None:
+        memo[key] = value
+    return value
+
+
+def _discard(predicate):
+    _shared.discard_matching(predicate)
+    memo = getattr(_request, 'memo', None)
+    if memo:
+        for key in [key for key in memo if predicate(key)]:
+            del memo[key]
+
+
+def invalidate_user(user_id, group_id):
+    """Forget everything cached about a user in a device group."""
+    _discard(lambda key: key[1] == group_id and user_id in key[2:])
+
+
+def invalidate_group(group_id):
+    """Forget everything cached about a device group and its users."""
+    _discard(lambda key: key[1] == group_id)
+
+
+def get_stats():
+    """Get the hit/miss counters.
+
+    Returns
+    -------
+    dict
+        `request_hits`, `shared_hits`, `misses` and the current `size` of the
+        container wide cache.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['size'] = len(_shared)
+    return stats
+
+
+def clear():
+    _shared.clear()
+    end_request()
@@ -0,0 +1,135 @@
+"""Caching of Cognito OpenID tokens.
+
+Tokens are cached in-process, keyed by the identity pool and logins they
+were issued for, and are reused while they have enough lifetime left. A
+shared backend (for example a table or a Redis instance reachable from every
+container) can be plugged in with `set_shared_backend`.
+"""
+import abc
+import hashlib
+import json
+import os
+import threading
+import time
+
+from app.managers.cache import TTLCache
+
+TOKEN_DURATION = int(os.environ.get('OPEN_ID_TOKEN_DURATION', 86400))
+# Tokens with less lifetime than this left are refreshed before being handed out.
+MIN_REMAINING = int(os.environ.get('OPEN_ID_TOKEN_MIN_REMAINING', 3600))
+
+
+class TokenCacheBackend(abc.ABC):
+    """The interface of a shared token cache."""
+
+    @abc.abstractmethod
+    def get(self, key):
+        """Get a cached `OpenIdToken` by key, or None."""
+
+    @abc.abstractmethod
+    def set(self, key, token):
+        """Cache an `OpenIdToken` until it expires."""
+
+
+class InProcessTokenCache(TokenCacheBackend):
+    def __init__(self, maxsize=256):
+        self._cache = TTLCache(maxsize=maxsize, ttl=TOKEN_DURATION)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, token):
+        self._cache.set(key, token, ttl=token.expires_at - time.time())
+
+    def stats(self):
+        return self._cache.stats()
+
+
+class OpenIdToken:
+    def __init__(self, token, identity_id, expires_at):
+        self.token = token
+        self.identity_id = identity_id
+        self.expires_at = expires_at
+
+    def remaining(self):
+        return self.expires_at - time.time()
+
+
+_local = InProcessTokenCache(
+    maxsize=int(os.environ.get('OPEN_ID_TOKEN_CACHE_SIZE', 256)))
+_shared = None
+_locks_lock = threading.Lock()
+_locks = {}
+
+
+def set_shared_backend(backend):
+    """Use `backend` as a second level cache shared between containers."""
+    global _shared
+    _shared = backend
+
+
+def cache_key(identity_pool_id, logins):
+    # Logins contain provider tokens, so only a digest of them is kept.
+    payload = json.dumps([identity_pool_id, sorted(logins.items())])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _usable(token, min_remaining):
+    return token is not None and token.remaining() >= min_remaining
+
+
+def _key_lock(key):
+    with _locks_lock:
+        if len(_locks) > 1024:
+            _locks.clear()
+        return _locks.setdefault(key, threading.Lock())
+
+
+def get_token(identity_pool_id, logins, fetch, min_remaining=None):
+    """Get a token for `logins`, fetching a new one only when needed.
+
+    Parameters
+    ----------
+    identity_pool_id: str
+        The identity pool the token is for.
+    logins: Dict[str, str]
+        The provider logins the token is for.
+    fetch: Callable[[], dict]
+        Calls `get_open_id_token_for_developer_identity` for these logins.
+    min_remaining: int, optional
+        The lifetime, in seconds, a cached token must still have.
+
+    Returns
+    -------
+    OpenIdToken
+    """
+    min_remaining = MIN_REMAINING if min_remaining is None else min_remaining
+    key = cache_key(identity_pool_id, logins)
+
+    token = _local.get(key)
+    if _usable(token, min_remaining):
+        return token
+
+    # Concurrent requests for the same logins share a single fetch.
+    with _key_lock(key):
+        token = _local.get(key)
+        if _usable(token, min_remaining):
+            return token
+        if _shared is not None:
+            token = _shared.get(key)
+            if _usable(token, min_remaining):
+                _local.set(key, token)
+                return token
+
+        issued_at = time.time()
+        response = fetch()
+        token = OpenIdToken(response['Token'], response['IdentityId'],
+                            issued_at + TOKEN_DURATION)
+        _local.set(key, token)
+        if _shared is not None:
+            _shared.set(key, token)
+        return token
+
+
+def get_stats():
+    return _local.stats()
@@ -1 +1,16 @@
-from .integrations import Integration, get_integrations
+from .integrations import (
+    Integration,
+    IntegrationCatalog,
+    get_integrations,
+    get_integrations_catalog,
+    invalidate_integrations_catalog
+)
+from .dashboard import (
+    Widget,
+    IntegrationInvoker,
+    LocalInvoker,
+    LambdaInvoker,
+    set_invoker,
+    get_user_integrations,
+    get_dashboard
+)
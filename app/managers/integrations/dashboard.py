@@ -0,0 +1,246 @@
+"""Rendering of the widgets on a user's mirror dashboard.
+
+Every integration the user has configured in a device group is invoked
+concurrently under a shared deadline, with one batch event (see
+`third_party.dispatch`) per integration function. Widgets that finish in time are
+returned; the others are reported as timed out and, when they do finish,
+their result is cached so the next poll picks it up. A widget is cached for
+as long as the `ttl` it declares.
+
+How integrations are invoked is pluggable: `LocalInvoker` calls the Python
+handlers in-process (so everything runs locally) and `LambdaInvoker` calls
+the deployed integration functions.
+"""
+import abc
+import decimal
+import importlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from app.managers import aws
+from app.managers import deadline as request_deadline
+from app.managers import tracing
+from app.managers.cache import TTLCache
+from .integrations import device_group_user_integrations_table, get_integrations_catalog
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_DEADLINE = float(os.environ.get('DASHBOARD_DEADLINE', 3))
+DASHBOARD_WORKERS = int(os.environ.get('DASHBOARD_WORKERS', 8))
+
+# Integrations that can be called in-process, by function name.
+LOCAL_HANDLERS = {
+    'weather': 'third_party.weather.weather_handler',
+}
+
+_widget_cache = TTLCache(maxsize=int(os.environ.get('WIDGET_CACHE_SIZE', 1024)))
+# Module level so that widgets still running at the deadline are not waited for.
+_executor = ThreadPoolExecutor(max_workers=DASHBOARD_WORKERS)
+
+
+class Widget:
+    OK = 'ok'
+    CACHED = 'cached'
+    TIMEOUT = 'timeout'
+    ERROR = 'error'
+
+    def __init__(self, integration_id, position, status, data=None):
+        self.integration_id = integration_id
+        self.position = position
+        self.status = status
+        self.data = data
+
+
+class IntegrationInvoker(abc.ABC):
+    """The interface of a way of invoking integration functions."""
+
+    @abc.abstractmethod
+    def invoke(self, function_name, event):
+        """Invoke an integration function and return its result."""
+
+
+class LocalInvoker(IntegrationInvoker):
+    """Calls the integration handlers in-process.
+
+    Parameters
+    ----------
+    handlers: Dict[str, Union[str, Callable]], optional
+        Handlers, or their dotted paths, by function name.
+    """
+
+    def __init__(self, handlers=None):
+        self.handlers = dict(LOCAL_HANDLERS if handlers is None else handlers)
+
+    def _handler(self, function_name):
+        handler = self.handlers[function_name]
+        if isinstance(handler, str):
+            module_name, _, attribute = handler.rpartition('.')
+            handler = getattr(importlib.import_module(module_name), attribute)
+            self.handlers[function_name] = handler
+        return handler
+
+    def invoke(self, function_name, event):
+        return self._handler(function_name)(event, None)
+
+
+def _json_default(value):
+    # DynamoDB numbers are Decimals.
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class LambdaInvoker(IntegrationInvoker):
+    """Invokes the deployed integration functions.
+
+    Parameters
+    ----------
+    prefix: str, optional
+        Prepended to the function name, e.g. the service and stage.
+    """
+
+    def __init__(self, prefix=None):
+        self.prefix = os.environ.get('INTEGRATION_FUNCTION_PREFIX', '') if prefix is None else prefix
+
+    def invoke(self, function_name, event):
+        response = aws.client('lambda').invoke(
+            FunctionName=self.prefix + function_name,
+            InvocationType='RequestResponse',
+            Payload=json.dumps(event, default=_json_default).encode('utf-8'))
+        payload = json.loads(response['Payload'].read().decode('utf-8') or 'null')
+        if 'FunctionError' in response:
+            raise RuntimeError(f"{function_name} failed: {payload}")
+        return payload
+
+
+def _default_invoker():
+    kind = os.environ.get('INTEGRATION_INVOKER')
+    if kind is None:
+        kind = 'lambda' if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ else 'local'
+    return LambdaInvoker() if kind == 'lambda' else LocalInvoker()
+
+
+_invoker = _default_invoker()
+
+
+def set_invoker(invoker):
+    """Use `invoker` to invoke integrations from now on."""
+    global _invoker
+    _invoker = invoker
+
+
+def get_user_integrations(user_id, group_id):
+    """Get the integrations a user has configured in a device group.
+
+    Returns
+    -------
+    List[dict]
+        `integrationId`, `position` and optional `params` of each integration,
+        in position order.
+    """
+    response = device_group_user_integrations_table.get_item(Key={
+        'groupId': group_id,
+        'userId': user_id
+    })
+    item = response.get('Item')
+    if not item:
+        return []
+    entries = item.get('integrations')
+    if entries is None:
+        # A single integration stored directly on the item.
+        entries = [item] if 'integrationId' in item else []
+    return sorted(entries, key=lambda entry: int(entry.get('position', 0)))
+
+
+def _widget_key(entry, user_id, group_id):
+    params = json.dumps(entry.get('params'), sort_keys=True, default=str)
+    return (entry['integrationId'], group_id, user_id, params)
+
+
+def _render(function_name, keys, tasks):
+    response = _invoker.invoke(function_name, {'tasks': tasks})
+    results = response['results']
+    if len(results) != len(tasks):
+        raise RuntimeError(f"{function_name} returned {len(results)} results for {len(tasks)} tasks.")
+    for key, result in zip(keys, results):
+        data = result.get('data')
+        if result.get('status') == 'ok' and isinstance(data, dict) and data.get('ttl'):
+            data = result['data'] = dict(data)
+            _widget_cache.set(key, data, ttl=float(data.pop('ttl')))
+    return results
+
+
+def get_dashboard(user_id, group_id, deadline=None):
+    """Render the widgets of a user in a device group.
+
+    Parameters
+    ----------
+    user_id: str
+        The unique id of the user.
+    group_id: str
+        The unique id of the group.
+    deadline: float, optional
+        Seconds to wait for the widgets, defaults to `DASHBOARD_DEADLINE`.
+
+    Returns
+    -------
+    List[Widget]
+        A widget for each configured integration, in position order.
+    """
+    deadline = DASHBOARD_DEADLINE if deadline is None else deadline
+    # Widgets are not waited for past the deadline of the request.
+    remaining = request_deadline.remaining()
+    if remaining is not None:
+        deadline = max(0, min(deadline, remaining))
+    started = time.monotonic()
+    function_names = {
+        integration.id: integration.function_name
+        for integration in get_integrations_catalog().integrations
+    }
+
+    widgets = []
+    batches = {}
+    for entry in get_user_integrations(user_id, group_id):
+        integration_id = entry['integrationId']
+        widget = Widget(integration_id, int(entry.get('position', 0)), Widget.ERROR)
+        widgets.append(widget)
+        if integration_id not in function_names:
+            continue
+        key = _widget_key(entry, user_id, group_id)
+        cached = _widget_cache.get(key)
+        if cached is not None:
+            widget.status, widget.data = Widget.CACHED, cached
+            continue
+        task = {
+            'context': 'widget',
+            'userId': user_id,
+            'groupId': group_id,
+            'params': entry.get('params'),
+        }
+        batch = batches.setdefault(function_names[integration_id], ([], [], []))
+        for values, value in zip(batch, (widget, key, task)):
+            values.append(value)
+
+    pending = {
+        _executor.submit(tracing.propagate(_render), function_name, keys, tasks): batch_widgets
+        for function_name, (batch_widgets, keys, tasks) in batches.items()
+    }
+    if pending:
+        wait(pending, timeout=max(0, deadline - (time.monotonic() - started)))
+    for future, batch_widgets in pending.items():
+        if not future.done():
+            for widget in batch_widgets:
+                widget.status = Widget.TIMEOUT
+        elif future.exception() is not None:
+            logger.warning("Widgets %s failed: %r",
+                           [widget.integration_id for widget in batch_widgets], future.exception())
+        else:
+            for widget, result in zip(batch_widgets, future.result()):
+                if result.get('status') == 'ok':
+                    widget.status, widget.data = Widget.OK, result.get('data')
+                else:
+                    logger.warning("Widget %s failed: %s", widget.integration_id, result.get('error'))
+    return widgets
@@ -1,23 +1,90 @@
-import boto3
 import base64
-import operator
+import hashlib
+import json
 import os
 import uuid
 import logging
 from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 
-dynamodb = boto3.resource('dynamodb')
+from app.managers import aws, bulk, wire
+from app.managers.cache import TTLCache
+from app.managers.models import Model
 
-device_group_user_integrations_table = dynamodb.Table(os.environ['DEVICE_GROUP_USERS_INTEGRATIONS_TABLE'])
-integrations_table = dynamodb.Table(os.environ['INTEGRATIONS_TABLE'])
+dynamodb = aws.lazy_resource('dynamodb')
+dynamodb_client = aws.lazy_raw_client('dynamodb')
 
+device_group_user_integrations_table = aws.lazy_table('DEVICE_GROUP_USERS_INTEGRATIONS_TABLE')
+integrations_table = aws.lazy_table('INTEGRATIONS_TABLE')
+
+CATALOG_TTL = float(os.environ.get('INTEGRATIONS_CATALOG_TTL', 300))
+
+_catalog_cache = TTLCache(maxsize=1, ttl=CATALOG_TTL)
+
+
+class Integration(Model):
+    __slots__ = ('id', 'name', 'function_name')
 
-class Integration:
     def __init__(self, id, name, function_name):
-        self.id = id
-        self.name = name
-        self.function_name = function_name
+        self._set('id', id)
+        self._set('name', name)
+        self._set('function_name', function_name)
+
+
+class IntegrationCatalog(Model):
+    """A snapshot of the available integrations.
+
+    The version is a hash of the content, so it only changes when an
+    integration does.
+    """
+    __slots__ = ('integrations', 'version')
+
+    def __init__(self, integrations, version):
+        self._set('integrations', tuple(integrations))
+        self._set('version', version)
+
+
+_INTEGRATION_ATTRIBUTES = (
+    ('integrationId', wire.string, None),
+    ('name', wire.string, None),
+    ('functionName', wire.string, None),
+)
+_decode_integration = wire.decoder(Integration, _INTEGRATION_ATTRIBUTES)
+
+
+def _load_integrations_catalog():
+    items = sorted(
+        bulk.paginate(dynamodb_client.scan,
+                      TableName=integrations_table.name,
+                      **wire.projection(_INTEGRATION_ATTRIBUTES)),
+        key=lambda item: item['integrationId']['S'])
+    digest = hashlib.sha256(
+        json.dumps(items, sort_keys=True).encode('utf-8'))
+    integrations = [_decode_integration(item) for item in items]
+    return IntegrationCatalog(integrations, digest.hexdigest()[:32])
+
+
+def get_integrations_catalog(refresh=False):
+    """Get the available integrations, scanning the table at most once per TTL.
+
+    Parameters
+    ----------
+    refresh: bool, optional
+        Scan the table even if a cached catalog is still valid.
+
+    Returns
+    -------
+    IntegrationCatalog
+    """
+    catalog = None if refresh else _catalog_cache.get('catalog')
+    if catalog is None:
+        catalog = _load_integrations_catalog()
+        _catalog_cache.set('catalog', catalog)
+    return catalog
+
+
+def invalidate_integrations_catalog():
+    _catalog_cache.clear()
 
 
 def get_integrations():
@@ -28,13 +95,4 @@ def get_integrations():
     List[Integration]
         A list of integrations.
     """
-    response = integrations_table.scan()
-    items = response['Items']
-
-    if not items:
-        return []
-
-    integrations = [
-        Integration(item['integrationId'], item['name'], item['functionName']) for item in items
-    ]
-    return integrations
+    return list(get_integrations_catalog().integrations)
@@ -0,0 +1,21 @@
+class Model:
+    """Base of the immutable models.
+
+    Subclasses list their attributes in `__slots__` and set them once in
+    `__init__` with `_set`, so instances are small and cannot be changed
+    after they are returned from a manager, even when shared through a cache.
+    """
+    __slots__ = ()
+
+    _set = object.__setattr__
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable.")
+
+    def __repr__(self):
+        attributes = ", ".join(
+            f"{name}={getattr(self, name)!r}" for name in self.__slots__ if not name.startswith('_'))
+        return f"{type(self).__name__}({attributes})"
@@ -0,0 +1,69 @@
+import random
+import time
+
+from botocore.exceptions import ClientError
+
+from app.managers import deadline
+
+THROTTLING_ERRORS = (
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+)
+
+
+def error_code(e):
+    """Get the AWS error code of a `ClientError`, or None."""
+    if hasattr(e, 'response'):
+        return e.response.get('Error', {}).get('Code')
+    return None
+
+
+def backoff_delays(attempts, base=0.05, cap=2.0):
+    """Yield `attempts` sleep times using exponential backoff with full jitter."""
+    for attempt in range(attempts):
+        yield random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def sleep_before_retry(delay):
+    """Sleep before a retry, or return False if the retry would miss the deadline."""
+    remaining = deadline.remaining()
+    if remaining is not None and remaining <= delay:
+        return False
+    time.sleep(delay)
+    return True
+
+
+def call_with_backoff(operation, *args, attempts=5, base=0.05, cap=2.0,
+                      retry_on=THROTTLING_ERRORS, **kwargs):
+    """Call an AWS operation, retrying with jittered backoff when throttled.
+
+    Parameters
+    ----------
+    operation: Callable
+        The client or resource method to call.
+    attempts: int, optional
+        The number of retries after the first call.
+    base: float, optional
+        The first backoff ceiling, in seconds.
+    cap: float, optional
+        The largest backoff ceiling, in seconds.
+    retry_on: Iterable[str], optional
+        The error codes that are retried.
+
+    Returns
+    -------
+    dict
+        The response of the operation.
+
+    Raises
+    ------
+    ClientError
+        When the error is not retryable or the retries are exhausted.
+    """
+    for delay in backoff_delays(attempts, base, cap):
+        try:
+            return operation(*args, **kwargs)
+        except ClientError as e:
+            if error_code(e) not in retry_on or not sleep_before_retry(delay):
+                raise
+    return operation(*args, **kwargs)
@@ -0,0 +1,213 @@
+"""Per-request tracing of AWS calls.
+
+Every call made through the shared AWS registry during a request is recorded
+by service operation (e.g. `dynamodb.GetItem`): how many calls, their total
+time, the retries botocore made and how many failed. At the end of the
+request the trace is sent back in a `Server-Timing` header and logged as one
+line in CloudWatch Embedded Metric Format, which makes repeated calls (N+1
+patterns) visible per route.
+
+The trace is thread-local, functions run on worker threads must be wrapped
+with `propagate` (or `deadline.propagate`) for their calls to be recorded.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+ENABLED = os.environ.get('AWS_CALL_TRACING', 'true').lower() not in ('0', 'false', 'no')
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'MagicMirrorApi')
+
+# The metrics line must be logged as is, without the prefix of the Lambda
+# log format, for CloudWatch to pick it up.
+metrics_logger = logging.getLogger('app.metrics')
+metrics_logger.propagate = False
+if not metrics_logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    metrics_logger.addHandler(_handler)
+    metrics_logger.setLevel(logging.INFO)
+
+_local = threading.local()
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 3)
+
+
+def _describe(count, singular, plural):
+    return f"{count} {singular if count == 1 else plural}"
+
+
+class OperationStats:
+    __slots__ = ('count', 'time', 'retries', 'errors')
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.retries = 0
+        self.errors = 0
+
+
+class Trace:
+    """The AWS calls of one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # 'service.Operation': OperationStats
+        self.operations = {}
+        # Other metrics of the request: (name, value, unit)
+        self.measurements = []
+        self._lock = threading.Lock()
+
+    def record(self, operation, duration, retries=0, error=False):
+        with self._lock:
+            stats = self.operations.get(operation)
+            if stats is None:
+                stats = self.operations[operation] = OperationStats()
+            stats.count += 1
+            stats.time += duration
+            stats.retries += retries
+            stats.errors += int(error)
+
+    def measure(self, name, value, unit='None'):
+        """Add a metric of the request, e.g. the size of its response."""
+        with self._lock:
+            self.measurements.append((name, value, unit))
+
+    def totals(self):
+        """Get the number of calls, their time in seconds and their retries."""
+        with self._lock:
+            stats = list(self.operations.values())
+        return (sum(s.count for s in stats), sum(s.time for s in stats), sum(s.retries for s in stats))
+
+    def server_timing(self):
+        """Get the value of the `Server-Timing` header."""
+        calls, duration, _ = self.totals()
+        entries = [f'aws;dur={duration * 1000:.1f};desc="{_describe(calls, "call", "calls")}"']
+        with self._lock:
+            operations = sorted(self.operations.items())
+        for operation, stats in operations:
+            description = _describe(stats.count, 'call', 'calls')
+            if stats.retries:
+                description += f", {_describe(stats.retries, 'retry', 'retries')}"
+            if stats.errors:
+                description += f", {_describe(stats.errors, 'error', 'errors')}"
+            entries.append(f'{operation};dur={stats.time * 1000:.1f};desc="{description}"')
+        return ", ".join(entries)
+
+    def metrics(self, route, method, status):
+        """Get the metrics of the request in CloudWatch Embedded Metric Format."""
+        calls, duration, retries = self.totals()
+        record = {
+            'Route': route,
+            'Method': method,
+            'Status': status,
+            'Latency': _milliseconds(time.perf_counter() - self.started),
+            'AwsCalls': calls,
+            'AwsTime': _milliseconds(duration),
+            'AwsRetries': retries,
+        }
+        metrics = [
+            {'Name': 'Latency', 'Unit': 'Milliseconds'},
+            {'Name': 'AwsCalls', 'Unit': 'Count'},
+            {'Name': 'AwsTime', 'Unit': 'Milliseconds'},
+            {'Name': 'AwsRetries', 'Unit': 'Count'},
+        ]
+        with self._lock:
+            operations = sorted(self.operations.items())
+            measurements = list(self.measurements)
+        for name, value, unit in measurements:
+            record[name] = value
+            metrics.append({'Name': name, 'Unit': unit})
+        for operation, stats in operations:
+            record[f"{operation}.Calls"] = stats.count
+            record[f"{operation}.Time"] = _milliseconds(stats.time)
+            metrics.append({'Name': f"{operation}.Calls", 'Unit': 'Count'})
+            metrics.append({'Name': f"{operation}.Time", 'Unit': 'Milliseconds'})
+            if stats.retries:
+                record[f"{operation}.Retries"] = stats.retries
+            if stats.errors:
+                record[f"{operation}.Errors"] = stats.errors
+        record['_aws'] = {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [['Route', 'Method']],
+                'Metrics': metrics,
+            }],
+        }
+        return record
+
+
+def start():
+    """Start tracing the AWS calls of a request on this thread."""
+    _local.trace = Trace() if ENABLED else None
+
+
+def current():
+    """Get the trace of the current request, or None when not tracing."""
+    return getattr(_local, 'trace', None)
+
+
+def activate(trace):
+    """Make `trace` the current trace of this thread, returning the previous one."""
+    previous = current()
+    _local.trace = trace
+    return previous
+
+
+def finish():
+    """Stop tracing on this thread, returning the trace of the request."""
+    return activate(None)
+
+
+def propagate(function):
+    """Wrap `function` so that its AWS calls are recorded in the current trace on any thread."""
+    trace = current()
+
+    def run(*args, **kwargs):
+        previous = activate(trace)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            activate(previous)
+
+    return run
+
+
+def emit(trace, route, method, status):
+    """Log the metrics line of a request."""
+    metrics_logger.info(json.dumps(trace.metrics(route, method, status), separators=(',', ':')))
+
+
+def _before_call(model, context, **kwargs):
+    if current() is not None:
+        context['trace_operation'] = f"{model.service_model.service_name}.{model.name}"
+        context['trace_started'] = time.perf_counter()
+
+
+def _after_call(parsed, context, **kwargs):
+    trace = current()
+    if trace is None or 'trace_started' not in context:
+        return
+    metadata = parsed.get('ResponseMetadata', {})
+    trace.record(context['trace_operation'], time.perf_counter() - context['trace_started'],
+                 metadata.get('RetryAttempts', 0), 'Error' in parsed)
+
+
+def _after_call_error(context, **kwargs):
+    # Raised without a response, e.g. a timeout once the retries are exhausted.
+    trace = current()
+    if trace is None or 'trace_started' not in context:
+        return
+    trace.record(context['trace_operation'], time.perf_counter() - context['trace_started'], error=True)
+
+
+def install(session):
+    """Record the calls of every client created from a boto3 session."""
+    session.events.register('before-call', _before_call)
+    session.events.register('after-call', _after_call)
+    session.events.register('after-call-error', _after_call_error)
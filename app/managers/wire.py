@@ -0,0 +1,116 @@
+"""Decoding of DynamoDB items as returned by the low-level client.
+
+The `Table` resource runs every attribute of every item through
+`TypeDeserializer`, making `Decimal` objects that the managers then convert
+again, and botocore has already walked the response shape attribute by
+attribute before that. For list endpoints the managers use a raw client
+(see `app.managers.aws.raw_client`), whose successful responses are the
+decoded JSON body as sent by DynamoDB, and a `decoder` turns each item
+straight into a model, reading only the projected attributes.
+"""
+import json
+
+from botocore.parsers import create_parser
+
+
+class RawResponseParserFactory:
+    """Makes parsers that skip the response shape of successful JSON responses.
+
+    Errors are still parsed by botocore, so retries and `ClientError`
+    behave as usual. Values are left as sent, e.g. binary attributes stay
+    base64 encoded.
+    """
+
+    def create_parser(self, protocol_name):
+        return _RawResponseParser(create_parser(protocol_name))
+
+
+class _RawResponseParser:
+    def __init__(self, parser):
+        self._parser = parser
+
+    def parse(self, response, shape):
+        if response['status_code'] >= 300 or shape is None:
+            return self._parser.parse(response, shape)
+        body = response['body']
+        parsed = json.loads(body.decode('utf-8')) if body else {}
+        headers = response['headers']
+        parsed['ResponseMetadata'] = {
+            'RequestId': headers.get('x-amzn-requestid', ''),
+            'HTTPStatusCode': response['status_code'],
+            'HTTPHeaders': headers,
+        }
+        return parsed
+
+
+def string(value):
+    return value['S']
+
+
+def number(value):
+    # Counters and versions are whole numbers.
+    return int(value['N'])
+
+
+def boolean(value):
+    return value['BOOL']
+
+
+def decoder(factory, attributes):
+    """Build a function that turns a wire item into a model.
+
+    Parameters
+    ----------
+    factory: Callable
+        Called with a value for each attribute, in order, e.g. a model class.
+    attributes: Iterable[Tuple[str, Callable, Any]]
+        The name of each attribute, the function that decodes its typed
+        value (`string`, `number` or `boolean`) and the value used when the
+        item does not have it.
+
+    Returns
+    -------
+    Callable[[dict], Any]
+    """
+    attributes = tuple(attributes)
+
+    def decode(item):
+        values = []
+        for name, decode_value, default in attributes:
+            value = item.get(name)
+            values.append(default if value is None else decode_value(value))
+        return factory(*values)
+
+    return decode
+
+
+def projection(attributes):
+    """The arguments that read exactly the attributes of a decoder.
+
+    Names are always given as placeholders, since some (e.g. `name`) are
+    DynamoDB reserved words.
+
+    Returns
+    -------
+    dict
+        The `ProjectionExpression` and its `ExpressionAttributeNames`.
+    """
+    names = {f"#a{index}": name for index, (name, _, _) in enumerate(attributes)}
+    return {
+        'ProjectionExpression': ", ".join(names),
+        'ExpressionAttributeNames': names,
+    }
+
+
+def string_key(key):
+    """Turn a key of string attributes, e.g. a `LastEvaluatedKey`, into plain values."""
+    if not key:
+        return None
+    return {name: value['S'] for name, value in key.items()}
+
+
+def wire_key(key):
+    """Turn a key of plain string values into the wire format."""
+    if not key:
+        return None
+    return {name: {'S': value} for name, value in key.items()}
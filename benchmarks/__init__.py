@@ -0,0 +1,18 @@
+"""Micro-benchmarks, run with ``python -m benchmarks.<name>`` from the repository root.
+
+The managers read their table names from the environment at import time, so
+placeholder values are provided for anything that is not already set.
+"""
+import os
+
+for _name, _value in (
+        ('AWS_DEFAULT_REGION', 'eu-west-1'),
+        ('DEVICE_GROUP_TABLE', 'bench-device-group'),
+        ('DEVICE_GROUP_USERS_TABLE', 'bench-device-group-users'),
+        ('DEVICE_GROUP_USER_FACES_TABLE', 'bench-device-group-user-faces'),
+        ('DEVICE_GROUP_USERS_INTEGRATIONS_TABLE', 'bench-device-group-user-integrations'),
+        ('INTEGRATIONS_TABLE', 'bench-integrations'),
+        ('IDENTITY_POOL_ID', 'eu-west-1:bench'),
+        ('DEVELOPER_PROVIDER_NAME', 'login.bench'),
+):
+    os.environ.setdefault(_name, _value)
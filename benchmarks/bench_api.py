@@ -0,0 +1,350 @@
+"""Benchmark every API resource offline, against in-memory AWS stand-ins.
+
+    python -m benchmarks.bench_api [--requests N] [--concurrency N]
+                                   [--latency [SERVICE[.OPERATION]=]SECONDS ...]
+                                   [--cold] [--only NAME ...]
+                                   [--save PATH] [--compare PATH]
+
+Each case is one endpoint and method, driven through the Flask test client
+with the stand-ins of `benchmarks.fake_aws` answering DynamoDB, Rekognition
+and Cognito. The p50/p95/p99 latency, the throughput and the number of AWS
+calls per request are reported for each case. Results can be saved, and
+compared with a saved baseline.
+
+By default the caches of the managers stay warm between requests, as in a
+warm container. With --cold they are cleared before every request.
+"""
+import argparse
+import base64
+import collections
+import io
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_aws import FakeAWS
+
+TABLES = (
+    # environment variable, hash key, range key, indexes
+    ('DEVICE_GROUP_TABLE', 'groupId', None, {}),
+    ('DEVICE_GROUP_USERS_TABLE', 'groupId', 'userId', {'useridGSI': ('userId', None)}),
+    ('DEVICE_GROUP_USER_FACES_TABLE', 'groupId', 'faceId', {'groupIdUserIdGSI': ('groupId', 'userId')}),
+    ('DEVICE_GROUP_USERS_INTEGRATIONS_TABLE', 'groupId', 'userId', {}),
+    ('INTEGRATIONS_TABLE', 'integrationId', None, {}),
+)
+
+GROUPS_PER_USER = 20
+MEMBERS_PER_GROUP = 50
+FACES_PER_MEMBER = 3
+# Relative changes smaller than this are reported as noise when comparing.
+NOISE = 0.05
+
+
+def sample_faces(count=FACES_PER_MEMBER):
+    """Distinct small JPEGs, as base64, standing in for camera images."""
+    from PIL import Image
+
+    faces = []
+    for index in range(count):
+        image = Image.effect_noise((320, 240), 32 + index).convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        faces.append(base64.b64encode(buffer.getvalue()).decode('ascii'))
+    return faces
+
+
+class Fixture:
+    """Seeds the stand-ins directly, so that setting up is neither timed nor counted."""
+
+    def __init__(self, fake):
+        self.fake = fake
+        self.tables = {}
+        for env_name, hash_key, range_key, indexes in TABLES:
+            self.tables[env_name] = fake.dynamodb.create_table(os.environ[env_name], hash_key, range_key, indexes)
+        self.faces = sample_faces()
+        self.tables['INTEGRATIONS_TABLE'].put({
+            'integrationId': {'S': 'weather'}, 'name': {'S': 'Weather'}, 'functionName': {'S': 'weather'}})
+
+    def user(self):
+        return f"eu-west-1:{uuid.uuid4()}"
+
+    def group(self, owner, members=0, faces=FACES_PER_MEMBER):
+        group_id = str(uuid.uuid4())
+        self.tables['DEVICE_GROUP_TABLE'].put(
+            {'groupId': {'S': group_id}, 'groupName': {'S': 'Bench'}, 'version': {'N': '1'}})
+        self.fake.rekognition.CreateCollection({'CollectionId': group_id})
+        self.member(group_id, owner, owner=True, faces=faces)
+        for _ in range(members):
+            self.member(group_id, self.user(), faces=faces)
+        return group_id
+
+    def member(self, group_id, user_id, owner=False, faces=FACES_PER_MEMBER):
+        self.tables['DEVICE_GROUP_USERS_TABLE'].put({
+            'groupId': {'S': group_id}, 'userId': {'S': user_id}, 'groupOwner': {'BOOL': owner},
+            'faceCount': {'N': str(faces)}, 'version': {'N': '1'}})
+        self.tables['DEVICE_GROUP_USERS_INTEGRATIONS_TABLE'].put({
+            'groupId': {'S': group_id}, 'userId': {'S': user_id},
+            'integrations': {'L': [{'M': {'integrationId': {'S': 'weather'}, 'position': {'N': '0'}}}]}})
+        for index in range(faces):
+            face_id = self.fake.rekognition.add_face(group_id, f"{user_id}/{index}", user_id)
+            self.tables['DEVICE_GROUP_USER_FACES_TABLE'].put(
+                {'groupId': {'S': group_id}, 'faceId': {'S': face_id}, 'userId': {'S': user_id}})
+        return user_id
+
+
+class Case:
+    """One endpoint and method.
+
+    Parameters
+    ----------
+    name: str
+    method: str
+    prepare: Callable[[Fixture, dict], Tuple[str, str, Optional[dict]]]
+        Makes the caller, path and JSON body of one request. It is given
+        the shared state made by `setup` and is not timed.
+    status: int
+        The expected status code.
+    """
+
+    def __init__(self, name, method, prepare, status=200):
+        self.name = name
+        self.method = method
+        self.prepare = prepare
+        self.status = status
+
+
+def setup(fixture):
+    owner = fixture.user()
+    groups = [fixture.group(owner, members=MEMBERS_PER_GROUP if index == 0 else 0)
+              for index in range(GROUPS_PER_USER)]
+    return {'owner': owner, 'group': groups[0]}
+
+
+def _as_owner(path, body=None):
+    return lambda fixture, state: (state['owner'], path.format(**state), body)
+
+
+def _new_group(fixture, state):
+    return fixture.user(), '/api/groups', {'name': 'Bench'}
+
+
+def _group_to_delete(fixture, state):
+    owner = fixture.user()
+    return owner, f"/api/groups/{fixture.group(owner, members=5)}", None
+
+
+def _joining_user(fixture, state):
+    user_id = fixture.user()
+    return user_id, f"/api/groups/{state['group']}/users", {'userId': user_id}
+
+
+def _member_to_delete(fixture, state):
+    user_id = fixture.member(state['group'], fixture.user(), faces=0)
+    return state['owner'], f"/api/groups/{state['group']}/users/{user_id}", None
+
+
+def _faces_to_register(fixture, state):
+    user_id = fixture.member(state['group'], fixture.user(), faces=0)
+    body = {'faces': fixture.faces, 'provider': 'login.bench', 'token': user_id}
+    return user_id, f"/api/groups/{state['group']}/users/{user_id}/faces", body
+
+
+def _faces_to_remove(fixture, state):
+    user_id = fixture.member(state['group'], fixture.user())
+    return user_id, f"/api/groups/{state['group']}/users/{user_id}/faces", None
+
+
+def _face_to_authenticate(path):
+    return lambda fixture, state: (state['owner'], path.format(**state), {'face': fixture.faces[0]})
+
+
+CASES = (
+    Case('groups.list', 'GET', _as_owner('/api/groups')),
+    Case('groups.page', 'GET', _as_owner('/api/groups?limit=10')),
+    Case('groups.create', 'POST', _new_group, 201),
+    Case('group.get', 'GET', _as_owner('/api/groups/{group}')),
+    Case('group.update', 'PUT', _as_owner('/api/groups/{group}', {'name': 'Bench'}), 201),
+    Case('group.delete', 'DELETE', _group_to_delete, 204),
+    Case('members.list', 'GET', _as_owner('/api/groups/{group}/users')),
+    Case('members.page', 'GET', _as_owner('/api/groups/{group}/users?limit=20')),
+    Case('members.join', 'POST', _joining_user, 201),
+    Case('member.get', 'GET', _as_owner('/api/groups/{group}/users/{owner}')),
+    Case('member.delete', 'DELETE', _member_to_delete, 204),
+    Case('faces.register', 'POST', _faces_to_register, 201),
+    Case('faces.remove', 'DELETE', _faces_to_remove),
+    Case('auth', 'POST', _face_to_authenticate('/api/groups/{group}/auth'), 201),
+    Case('auth.multi', 'POST', _face_to_authenticate('/api/groups/{group}/auth?multi=true'), 201),
+    Case('integrations.list', 'GET', _as_owner('/api/integrations')),
+    Case('dashboard', 'GET', _as_owner('/api/groups/{group}/dashboard')),
+)
+
+
+def clear_caches():
+    from app.managers.device_group import face_index, membership, tokens
+    from app.managers.integrations import dashboard, invalidate_integrations_catalog
+
+    membership.clear()
+    face_index.clear()
+    invalidate_integrations_catalog()
+    dashboard._widget_cache.clear()
+    tokens._local._cache.clear()
+
+
+def percentile(sorted_values, fraction):
+    """The nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def run_case(app, fake, fixture, state, case, requests, concurrency, cold, warmup):
+    prepared = [case.prepare(fixture, state) for _ in range(requests + warmup)]
+    latencies = []
+    statuses = collections.Counter()
+    lock = threading.Lock()
+    local = threading.local()
+
+    def send(arguments):
+        user_id, path, body = arguments
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        if cold:
+            clear_caches()
+        event = {'requestContext': {'identity': {'cognitoIdentityId': user_id}}}
+        start = time.perf_counter()
+        response = client.open(path, method=case.method, json=body, environ_base={'event': event})
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[response.status_code] += 1
+
+    for arguments in prepared[:warmup]:
+        send(arguments)
+    latencies.clear()
+    statuses.clear()
+
+    calls_before = fake.call_count()
+    operations_before = collections.Counter(fake.calls)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, prepared[warmup:]))
+    wall = time.perf_counter() - start
+    operations = collections.Counter(fake.calls)
+    operations.subtract(operations_before)
+
+    latencies.sort()
+    return {
+        'method': case.method,
+        'requests': requests,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'throughput_rps': requests / wall if wall else 0.0,
+        'aws_calls_per_request': (fake.call_count() - calls_before) / requests,
+        'aws_calls_by_operation': {
+            operation: count / requests for operation, count in sorted(operations.items()) if count
+        },
+        'errors': sum(count for status, count in statuses.items() if status != case.status),
+        'statuses': {str(status): count for status, count in statuses.items()},
+    }
+
+
+def parse_latency(values):
+    latency = {}
+    for value in values or ():
+        key, _, seconds = value.rpartition('=')
+        latency[key or '*'] = float(seconds)
+    return latency
+
+
+def compare(results, baseline):
+    """Print the change of every metric against a baseline, positive is better."""
+    print(f"\nCompared with {baseline['created']} ({baseline['settings']}), positive is better")
+    print(f"{'case':<20} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9} {'calls':>7}")
+    for name, result in results.items():
+        before = baseline['cases'].get(name)
+        if before is None:
+            print(f"{name:<20} {'new':>9}")
+            continue
+
+        def change(metric, higher_is_better=False):
+            if not before[metric]:
+                return f"{'-':>9}"
+            delta = (result[metric] - before[metric]) / before[metric]
+            if higher_is_better:
+                delta = -delta
+            if abs(delta) < NOISE:
+                return f"{'~':>9}"
+            return f"{-delta:+8.0%} "
+
+        calls = result['aws_calls_per_request'] - before['aws_calls_per_request']
+        print(f"{name:<20} {change('p50_ms')}{change('p95_ms')}{change('p99_ms')}"
+              f"{change('throughput_rps', higher_is_better=True)} {calls:+7.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help="timed requests per case")
+    parser.add_argument('--warmup', type=int, default=10, help="untimed requests per case")
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--latency', nargs='*', metavar='[SERVICE[.OPERATION]=]SECONDS',
+                        help="e.g. 0.005 dynamodb=0.004 rekognition.IndexFaces=0.3")
+    parser.add_argument('--cold', action='store_true', help="clear the caches before every request")
+    parser.add_argument('--only', nargs='*', metavar='NAME', help="run only these cases")
+    parser.add_argument('--save', metavar='PATH', help="save the results as JSON")
+    parser.add_argument('--compare', metavar='PATH', help="compare with results saved earlier")
+    args = parser.parse_args()
+
+    fake = FakeAWS(latency=parse_latency(args.latency))
+    fake.install()
+    import logging
+
+    # Expected failures, e.g. of stand-in limits, are logged with a traceback.
+    logging.disable(logging.CRITICAL)
+    # The cases call the same group from the same device in a loop.
+    os.environ.setdefault('ADMISSION_CONTROL', 'false')
+    from app.app import app
+
+    fixture = Fixture(fake)
+    state = setup(fixture)
+    cases = [case for case in CASES if not args.only or case.name in args.only]
+
+    print(f"{'case':<20} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9} {'calls':>7} {'errors':>7}  (ms)")
+    results = collections.OrderedDict()
+    for case in cases:
+        result = run_case(app, fake, fixture, state, case, args.requests, args.concurrency,
+                          args.cold, args.warmup)
+        results[case.name] = result
+        print(f"{case.name:<20} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f} {result['p99_ms']:9.2f}"
+              f" {result['throughput_rps']:9.1f} {result['aws_calls_per_request']:7.1f} {result['errors']:7d}")
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'settings': {
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'latency': parse_latency(args.latency),
+            'cold': args.cold,
+        },
+        'cases': results,
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    if any(result['errors'] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
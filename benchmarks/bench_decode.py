@@ -0,0 +1,112 @@
+"""Compare reading members through the `Table` resource and the wire decoder.
+
+    python -m benchmarks.bench_decode [--runs N] [--items N ...]
+
+A `Query` of the members table is answered in-process with a page of
+generated items, so both paths include parsing the response but not the
+network. The resource path deserializes every attribute and copies it into
+a model the way the managers used to, the client path uses the raw client
+and `app.managers.wire`.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from app.managers import aws
+from app.managers.device_group import device_group_manager as manager
+from app.managers.device_group.device_group_manager import DeviceGroupUser
+
+ITEM_COUNTS = (100, 1000, 5000)
+
+
+class _Body:
+    def __init__(self, data):
+        self._data = data
+
+    def stream(self, **kwargs):
+        yield self._data
+
+
+def wire_items(count):
+    return [
+        {
+            'groupId': {'S': 'bench-group'},
+            'userId': {'S': f"eu-west-1:{index:032x}"},
+            'groupOwner': {'BOOL': index == 0},
+            'faceCount': {'N': str(index % 12)},
+            'version': {'N': str(1 + index % 5)},
+        }
+        for index in range(count)
+    ]
+
+
+class _Answer:
+    """Answers every request with the current page, registered before any client is built."""
+
+    def __init__(self):
+        self.body = b'{}'
+
+    def set_items(self, items):
+        self.body = json.dumps(
+            {'Items': items, 'Count': len(items), 'ScannedCount': len(items)}).encode('utf-8')
+
+    def __call__(self, request, **kwargs):
+        from botocore.awsrequest import AWSResponse
+
+        return AWSResponse(request.url, 200, {}, _Body(self.body))
+
+
+def resource_path(group_id):
+    response = manager.device_group_users_table.query(
+        KeyConditionExpression=manager.Key('groupId').eq(group_id),
+        ProjectionExpression="groupId, userId, groupOwner, faceCount, version")
+    return [
+        DeviceGroupUser(item['userId'], item['groupId'], item['groupOwner'],
+                        int(item['faceCount']), int(item.get('version', 0)))
+        for item in response['Items']
+    ]
+
+
+def client_path(group_id):
+    items, _ = next(manager._query_users_in_device_group(group_id))
+    return manager._to_device_group_users(group_id, items)
+
+
+def bench(function, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function('bench-group')
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--items', type=int, nargs='*', default=ITEM_COUNTS)
+    args = parser.parse_args()
+
+    # Requests are never sent, but they are still signed.
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    # Clients copy the session's handlers when they are built.
+    answer = _Answer()
+    for session in (aws.get_session(), aws.get_raw_session()):
+        session.events.register('before-send', answer)
+
+    print(f"{'items':>7} {'resource':>11} {'client':>11} {'speedup':>8}  (median of {args.runs}, ms)")
+    for count in args.items:
+        answer.set_items(wire_items(count))
+        # The first call may build the clients, keep it out of the timings.
+        resource_path('bench-group')
+        client_path('bench-group')
+        resource = bench(resource_path, args.runs)
+        client = bench(client_path, args.runs)
+        print(f"{count:>7} {resource:11.2f} {client:11.2f} {resource / client:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
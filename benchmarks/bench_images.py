@@ -0,0 +1,66 @@
+"""Benchmark the image normalisation stage on synthetic camera images.
+
+    python -m benchmarks.bench_images [--runs N] [IMAGE ...]
+
+Sample images at common phone and webcam resolutions are generated unless
+image files are given.
+"""
+import argparse
+import base64
+import io
+import statistics
+import time
+
+from app.managers.device_group import images
+
+SAMPLE_SIZES = ((4032, 3024), (1920, 1080), (1280, 720), (640, 480))
+
+
+def sample_image(width, height):
+    from PIL import Image
+
+    # Noise compresses like a photo does, a flat image would flatter the results.
+    noise = Image.effect_noise((width, height), 64).convert('RGB')
+    gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    buffer = io.BytesIO()
+    Image.blend(noise, gradient, 0.5).save(buffer, 'JPEG', quality=92)
+    return buffer.getvalue()
+
+
+def bench(name, data, runs):
+    encoded = base64.b64encode(data).decode('utf-8')
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = images.normalise_image(encoded)
+        timings.append(time.perf_counter() - start)
+    print(f"{name:>12}  {len(data) / 1024:9.0f}KB -> {len(result.data) / 1024:7.0f}KB"
+          f"  saved {result.bytes_saved / 1024:9.0f}KB"
+          f"  median {statistics.median(timings) * 1000:8.2f}ms"
+          f"  max {max(timings) * 1000:8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('paths', nargs='*', metavar='IMAGE')
+    args = parser.parse_args()
+
+    if images.Image is None:
+        parser.exit(1, "Pillow is not installed, images would be passed through untouched.\n")
+
+    if args.paths:
+        samples = [(path.rsplit('/', 1)[-1], open(path, 'rb').read()) for path in args.paths]
+    else:
+        samples = [(f"{w}x{h}", sample_image(w, h)) for w, h in SAMPLE_SIZES]
+
+    print(f"max dimension {images.MAX_DIMENSION}px, byte budget {images.BYTE_BUDGET // 1024}KB,"
+          f" {args.runs} runs each")
+    for name, data in samples:
+        bench(name, data, args.runs)
+    stats = images.get_stats()
+    print(f"total saved {stats['bytes_saved'] / 1024 / 1024:.1f}MB over {stats['images']} images")
+
+
+if __name__ == '__main__':
+    main()
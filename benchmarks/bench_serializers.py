@@ -0,0 +1,76 @@
+"""Compare Flask-RESTful `marshal` with the compiled serializers.
+
+    python -m benchmarks.bench_serializers [--runs N] [--items N ...]
+
+Each field spec of the list endpoints is serialized from a list of models,
+once with `marshal` as `marshal_with` does and once with the function
+`compile_fields` made from it. Both include encoding the result to JSON, as
+Flask-RESTful does before answering.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from flask_restful import marshal
+
+from app.api.device_group.device_group import device_group_fields, device_group_user_fields
+from app.api.integrations.integrations import integrations_fields
+from app.api.serializers import compile_fields
+from app.managers.device_group import DeviceGroup, DeviceGroupUser
+from app.managers.integrations import Integration
+
+ITEM_COUNTS = (10, 1000, 10000)
+
+
+def device_groups(count):
+    return [DeviceGroup(f"{index:08x}-5f1e-11e8-9c2d-fa7ae01bbebc", f"Group {index}", 1 + index % 5)
+            for index in range(count)]
+
+
+def device_group_users(count):
+    return [DeviceGroupUser(f"eu-west-1:{index:032x}", 'bench-group', index == 0, index % 12, 1)
+            for index in range(count)]
+
+
+def integrations(count):
+    return [Integration(f"integration-{index}", f"Integration {index}", f"integration-{index}")
+            for index in range(count)]
+
+
+SPECS = (
+    ('device_group_fields', device_group_fields, device_groups),
+    ('device_group_user_fields', device_group_user_fields, device_group_users),
+    ('integrations_fields', integrations_fields, integrations),
+)
+
+
+def bench(function, data, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        json.dumps(function(data))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--items', type=int, nargs='*', default=ITEM_COUNTS)
+    args = parser.parse_args()
+
+    print(f"{'spec':<26} {'items':>7} {'marshal':>10} {'compiled':>10} {'speedup':>8}  (median of {args.runs}, ms)")
+    for name, spec, make in SPECS:
+        serialize = compile_fields(spec)
+        for count in args.items:
+            data = make(count)
+            if json.dumps(serialize(data)) != json.dumps(marshal(data, spec)):
+                raise SystemExit(f"{name} serializes differently from marshal.")
+            marshalled = bench(lambda items: marshal(items, spec), data, args.runs)
+            compiled = bench(serialize, data, args.runs)
+            print(f"{name:<26} {count:>7} {marshalled:10.3f} {compiled:10.3f} {marshalled / compiled:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Measure the cold start budget: import time and time to first response.
+
+    python -m benchmarks.bench_startup [--runs N] [--only NAME ...]
+
+Each case of `benchmarks.bench_api` is measured in a fresh interpreter, like
+a new Lambda container: importing the app (boto3 and botocore included),
+creating the AWS session, then the first and a second request, on the
+success path against seeded in-memory stand-ins. The numbers cover
+importing, building clients and routing but not the network.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def child(name):
+    """Runs in the fresh interpreter, prints the timings as JSON."""
+    start = time.perf_counter()
+    from app.app import app
+    imported = time.perf_counter()
+
+    import logging
+
+    from benchmarks.bench_api import CASES, Fixture, setup
+    from benchmarks.fake_aws import FakeAWS
+
+    # Expected failures, e.g. of stand-in limits, are logged with a traceback.
+    logging.disable(logging.CRITICAL)
+    fake = FakeAWS()
+    session_start = time.perf_counter()
+    fake.install()
+    session = time.perf_counter() - session_start
+    fixture = Fixture(fake)
+    state = setup(fixture)
+    case, = [case for case in CASES if case.name == name]
+    requests = [case.prepare(fixture, state) for _ in range(2)]
+
+    client = app.test_client()
+    timings, statuses = [], []
+    for user_id, path, body in requests:
+        event = {'requestContext': {'identity': {'cognitoIdentityId': user_id}}}
+        request_start = time.perf_counter()
+        response = client.open(path, method=case.method, json=body, environ_base={'event': event})
+        timings.append(time.perf_counter() - request_start)
+        statuses.append(response.status_code)
+    print(json.dumps({
+        'import': imported - start,
+        'session': session,
+        'first': timings[0],
+        'warm': timings[1],
+        'ok': all(status == case.status for status in statuses),
+        'status': statuses[0],
+    }))
+
+
+def measure(name, env):
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'benchmarks.bench_startup', '--child', name], env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--only', nargs='*', metavar='NAME', help="run only these cases")
+    parser.add_argument('--child', metavar='NAME', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    from benchmarks.bench_api import CASES, TABLES
+
+    env = dict(os.environ)
+    for env_name, _, _, _ in TABLES:
+        env.setdefault(env_name, env_name.lower())
+    env.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+    env.setdefault('IDENTITY_POOL_ID', 'bench')
+    env.setdefault('DEVELOPER_PROVIDER_NAME', 'login.bench')
+    # Each case calls the same group from the same device.
+    env.setdefault('ADMISSION_CONTROL', 'false')
+
+    print(f"{'case':<20} {'import':>9} {'session':>9} {'first':>9} {'warm':>9}  status"
+          f"  (median of {args.runs}, ms)")
+    failed = False
+    for case in CASES:
+        if args.only and case.name not in args.only:
+            continue
+        results = [measure(case.name, env) for _ in range(args.runs)]
+
+        def median(name):
+            return statistics.median(result[name] for result in results) * 1000
+
+        ok = all(result['ok'] for result in results)
+        failed = failed or not ok
+        print(f"{case.name:<20} {median('import'):9.1f} {median('session'):9.1f} {median('first'):9.1f}"
+              f" {median('warm'):9.2f}  {results[-1]['status']}{'' if ok else ' (unexpected)'}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,757 @@
+"""In-memory stand-ins for DynamoDB, Rekognition and Cognito Identity.
+
+`FakeAWS.install` answers every request of the shared AWS registry from
+memory, after it has been serialized and signed, so the managers run exactly
+as they would against the real services. Latency can be injected per service
+or per operation, and every call is counted.
+
+Only what the managers use is implemented: the key, condition, filter,
+update and projection expressions they send, pagination, and batches.
+
+The Rekognition stand-in recognises an image indexed into a collection when
+it is searched for again byte for byte, and recognises any other image as
+the first face indexed into the collection, so that authentication succeeds
+whenever a group has faces.
+"""
+import base64
+import collections
+import decimal
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from botocore.awsrequest import AWSResponse
+
+from app.managers import aws
+
+# The reserved words an attribute of the tables could plausibly be named,
+# the full list has several hundred.
+RESERVED_WORDS = frozenset((
+    'count', 'data', 'date', 'name', 'position', 'size', 'status',
+    'time', 'timestamp', 'type', 'user', 'value',
+))
+
+
+class _Body:
+    def __init__(self, data):
+        self._data = data
+
+    def stream(self, **kwargs):
+        yield self._data
+
+
+class ServiceError(Exception):
+    def __init__(self, code, message, status=400, **details):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        # Modelled fields of the error, e.g. `CancellationReasons`.
+        self.details = details
+
+
+class FakeAWS:
+    """Answers AWS requests from memory.
+
+    Parameters
+    ----------
+    latency: Dict[str, float], optional
+        Seconds added to each call, by service (e.g. 'dynamodb') or by
+        operation (e.g. 'rekognition.IndexFaces'), an operation wins over its
+        service. The key '*' applies to every call.
+    """
+
+    def __init__(self, latency=None):
+        self.latency = dict(latency or {})
+        self.dynamodb = FakeDynamoDB()
+        self.rekognition = FakeRekognition()
+        self.cognito_identity = FakeCognitoIdentity()
+        self.calls = collections.Counter()
+        self._calls_lock = threading.Lock()
+        self._services = {
+            'DynamoDB_20120810': ('dynamodb', self.dynamodb),
+            'RekognitionService': ('rekognition', self.rekognition),
+            'AWSCognitoIdentityService': ('cognito-identity', self.cognito_identity),
+        }
+
+    def install(self):
+        """Answer every request of the shared registry, from now on.
+
+        Clients copy the handlers of their session when they are built, so
+        the registry is reset and rebuilt with the stand-ins in place.
+        """
+        # Requests are never sent, but they are still signed.
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'fake')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'fake')
+        aws.reset()
+        for session in (aws.get_session(), aws.get_raw_session()):
+            session.events.register('before-send', self)
+
+    def call_count(self):
+        with self._calls_lock:
+            return sum(self.calls.values())
+
+    def _latency(self, service, operation):
+        for key in (f"{service}.{operation}", service, '*'):
+            if key in self.latency:
+                return self.latency[key]
+        return 0
+
+    def __call__(self, request, **kwargs):
+        target = request.headers.get('X-Amz-Target', b'')
+        if isinstance(target, bytes):
+            target = target.decode('ascii')
+        prefix, _, operation = target.partition('.')
+        service, stand_in = self._services.get(prefix, (prefix or 'unknown', None))
+        with self._calls_lock:
+            self.calls[f"{service}.{operation}"] += 1
+
+        delay = self._latency(service, operation)
+        if delay:
+            time.sleep(delay)
+
+        body = request.body or b'{}'
+        if not isinstance(body, bytes):
+            body = body.read() if hasattr(body, 'read') else body.encode('utf-8')
+        try:
+            handler = getattr(stand_in, operation, None) if stand_in else None
+            if handler is None:
+                raise ServiceError('UnknownOperationException', f"{target or request.url} is not supported.")
+            status, payload = 200, handler(json.loads(body.decode('utf-8') or '{}'))
+        except ServiceError as e:
+            status, payload = e.status, dict(e.details, __type=e.code, message=str(e))
+        data = json.dumps(payload, default=_json_default).encode('utf-8')
+        headers = {'x-amzn-requestid': str(uuid.uuid4()), 'Content-Type': 'application/x-amz-json-1.0'}
+        return AWSResponse(request.url, status, headers, _Body(data))
+
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+# DynamoDB
+
+def _plain(value):
+    """The Python value of a typed attribute value, for comparisons."""
+    (kind, data), = value.items()
+    if kind == 'N':
+        return decimal.Decimal(data)
+    if kind == 'NS':
+        return frozenset(decimal.Decimal(number) for number in data)
+    if kind in ('SS', 'BS'):
+        return frozenset(data)
+    if kind == 'NULL':
+        return None
+    if kind == 'L':
+        return tuple(_plain(element) for element in data)
+    if kind == 'M':
+        return tuple(sorted((name, _plain(element)) for name, element in data.items()))
+    return data
+
+
+def _typed(plain, like):
+    """The typed attribute value of `plain`, of the same type as `like`."""
+    kind, = like
+    if kind == 'N':
+        return {'N': str(plain)}
+    if kind in ('SS', 'BS'):
+        return {kind: sorted(plain)}
+    if kind == 'NS':
+        return {kind: sorted(str(number) for number in plain)}
+    return {kind: plain}
+
+
+_TOKEN = re.compile(r"\s*(?:(<>|<=|>=|=|<|>)|([(),+\-])|([#:]?[A-Za-z_][A-Za-z0-9_]*))")
+_COMPARISONS = {
+    '=': lambda a, b: a == b,
+    '<>': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+}
+
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if not match or match.end() == position:
+            raise ServiceError('ValidationException', f"Invalid expression: {expression}")
+        tokens.append(match.group(match.lastindex))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """Parses condition expressions into nested tuples."""
+
+    def __init__(self, expression, names, values):
+        self.tokens = _tokenize(expression)
+        self.position = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if token is None or (expected is not None and token.upper() != expected):
+            raise ServiceError('ValidationException', f"Expected {expected}, got {token}.")
+        self.position += 1
+        return token
+
+    def condition(self):
+        node = self.disjunction()
+        if self.peek() is not None:
+            raise ServiceError('ValidationException', f"Unexpected {self.peek()}.")
+        return node
+
+    def disjunction(self):
+        nodes = [self.conjunction()]
+        while (self.peek() or '').upper() == 'OR':
+            self.take()
+            nodes.append(self.conjunction())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+    def conjunction(self):
+        nodes = [self.negation()]
+        while (self.peek() or '').upper() == 'AND':
+            self.take()
+            nodes.append(self.negation())
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def negation(self):
+        if (self.peek() or '').upper() == 'NOT':
+            self.take()
+            return ('not', self.negation())
+        return self.primary()
+
+    def primary(self):
+        token = self.peek()
+        if token == '(':
+            self.take()
+            node = self.disjunction()
+            self.take(')')
+            return node
+        if token in ('attribute_exists', 'attribute_not_exists', 'begins_with'):
+            self.take()
+            self.take('(')
+            arguments = [self.operand()]
+            while self.peek() == ',':
+                self.take()
+                arguments.append(self.operand())
+            self.take(')')
+            return ('function', token, arguments)
+        left = self.operand()
+        operator = self.take()
+        if operator.upper() == 'BETWEEN':
+            low = self.operand()
+            self.take('AND')
+            return ('between', left, low, self.operand())
+        if operator not in _COMPARISONS:
+            raise ServiceError('ValidationException', f"Unsupported operator {operator}.")
+        return ('compare', operator, left, self.operand())
+
+    def operand(self):
+        token = self.take()
+        if token.startswith(':'):
+            if token not in self.values:
+                raise ServiceError('ValidationException', f"Missing value {token}.")
+            return ('value', self.values[token])
+        return ('path', self.names.get(token, token))
+
+
+def _resolve(operand, item):
+    kind, data = operand
+    return data if kind == 'value' else item.get(data)
+
+
+def _evaluate(node, item):
+    kind = node[0]
+    if kind == 'and':
+        return all(_evaluate(child, item) for child in node[1])
+    if kind == 'or':
+        return any(_evaluate(child, item) for child in node[1])
+    if kind == 'not':
+        return not _evaluate(node[1], item)
+    if kind == 'function':
+        name, arguments = node[1], node[2]
+        value = _resolve(arguments[0], item)
+        if name == 'attribute_exists':
+            return value is not None
+        if name == 'attribute_not_exists':
+            return value is None
+        prefix = _resolve(arguments[1], item)
+        return value is not None and str(_plain(value)).startswith(str(_plain(prefix)))
+    if kind == 'between':
+        value, low, high = (_resolve(operand, item) for operand in node[1:])
+        return value is not None and _plain(low) <= _plain(value) <= _plain(high)
+    left, right = _resolve(node[2], item), _resolve(node[3], item)
+    if left is None or right is None:
+        return node[1] == '<>' and (left is None) != (right is None)
+    try:
+        return _COMPARISONS[node[1]](_plain(left), _plain(right))
+    except TypeError:
+        return False
+
+
+def _conjuncts(node):
+    return node[1] if node[0] == 'and' else [node]
+
+
+def _split_top_level(text, separator=','):
+    parts, depth, current = [], 0, []
+    for character in text:
+        if character == '(':
+            depth += 1
+        elif character == ')':
+            depth -= 1
+        if character == separator and depth == 0:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(character)
+    parts.append(''.join(current))
+    return [part.strip() for part in parts if part.strip()]
+
+
+class _Table:
+    def __init__(self, hash_key, range_key=None, indexes=None):
+        self.hash_key = hash_key
+        self.range_key = range_key
+        # name: (hash key, range key)
+        self.indexes = dict(indexes or {})
+        # hash value: {primary key: item}
+        self.partitions = {}
+        self.lock = threading.RLock()
+
+    def key_names(self, index_name=None):
+        if index_name is None:
+            return self.hash_key, self.range_key
+        if index_name not in self.indexes:
+            raise ServiceError('ValidationException', f"The table does not have the index {index_name}.")
+        return self.indexes[index_name]
+
+    def primary_key(self, item):
+        try:
+            key = (_plain(item[self.hash_key]),)
+            if self.range_key:
+                key += (_plain(item[self.range_key]),)
+        except KeyError as e:
+            raise ServiceError('ValidationException', f"Missing key attribute {e}.") from e
+        return key
+
+    def get(self, key):
+        return self.partitions.get(_plain(key[self.hash_key]), {}).get(self.primary_key(key))
+
+    def put(self, item):
+        self.partitions.setdefault(_plain(item[self.hash_key]), {})[self.primary_key(item)] = item
+
+    def delete(self, key):
+        partition = self.partitions.get(_plain(key[self.hash_key]), {})
+        return partition.pop(self.primary_key(key), None)
+
+    def items(self, hash_value=None):
+        if hash_value is not None:
+            return list(self.partitions.get(hash_value, {}).values())
+        return [item for partition in self.partitions.values() for item in partition.values()]
+
+    def __len__(self):
+        return sum(len(partition) for partition in self.partitions.values())
+
+
+def _project(item, expression, names):
+    if not expression:
+        return dict(item)
+    projected = {}
+    for name in _split_top_level(expression):
+        if name.lower() in RESERVED_WORDS:
+            raise ServiceError('ValidationException',
+                               f"Invalid ProjectionExpression: Attribute name is a reserved keyword; "
+                               f"reserved keyword: {name}")
+        name = names.get(name, name) if names else name
+        if name in item:
+            projected[name] = item[name]
+    return projected
+
+
+class FakeDynamoDB:
+    """The DynamoDB operations used by the managers, on in-memory tables."""
+
+    def __init__(self):
+        self.tables = {}
+
+    def create_table(self, name, hash_key, range_key=None, indexes=None):
+        self.tables[name] = _Table(hash_key, range_key, indexes)
+        return self.tables[name]
+
+    def _table(self, name):
+        try:
+            return self.tables[name]
+        except KeyError:
+            raise ServiceError('ResourceNotFoundException', f"Requested resource not found: Table: {name}")
+
+    def _check(self, request, item):
+        expression = request.get('ConditionExpression')
+        if expression and not _evaluate(
+                _Parser(expression, request.get('ExpressionAttributeNames'),
+                        request.get('ExpressionAttributeValues')).condition(),
+                item or {}):
+            raise ServiceError('ConditionalCheckFailedException', "The conditional request failed")
+
+    def GetItem(self, request):
+        table = self._table(request['TableName'])
+        with table.lock:
+            item = table.get(request['Key'])
+        if item is None:
+            return {}
+        return {'Item': _project(item, request.get('ProjectionExpression'),
+                                 request.get('ExpressionAttributeNames'))}
+
+    def PutItem(self, request):
+        table = self._table(request['TableName'])
+        with table.lock:
+            old = table.get(request['Item'])
+            self._check(request, old)
+            table.put(request['Item'])
+        if request.get('ReturnValues') == 'ALL_OLD' and old:
+            return {'Attributes': old}
+        return {}
+
+    def DeleteItem(self, request):
+        table = self._table(request['TableName'])
+        with table.lock:
+            old = table.get(request['Key'])
+            self._check(request, old)
+            if old is not None:
+                table.delete(request['Key'])
+        if request.get('ReturnValues') == 'ALL_OLD' and old:
+            return {'Attributes': old}
+        return {}
+
+    def UpdateItem(self, request):
+        table = self._table(request['TableName'])
+        names = request.get('ExpressionAttributeNames') or {}
+        values = request.get('ExpressionAttributeValues') or {}
+        with table.lock:
+            old = table.get(request['Key'])
+            self._check(request, old)
+            item = dict(old or request['Key'])
+            updated = self._apply_update(item, request.get('UpdateExpression', ''), names, values)
+            table.put(item)
+        return_values = request.get('ReturnValues', 'NONE')
+        if return_values == 'ALL_NEW':
+            return {'Attributes': item}
+        if return_values == 'UPDATED_NEW':
+            return {'Attributes': {name: item[name] for name in updated if name in item}}
+        if return_values == 'ALL_OLD' and old:
+            return {'Attributes': old}
+        return {}
+
+    def _apply_update(self, item, expression, names, values):
+        updated = []
+        clauses = re.split(r"\b(SET|ADD|REMOVE|DELETE)\b", expression, flags=re.IGNORECASE)
+        for keyword, actions in zip(clauses[1::2], clauses[2::2]):
+            keyword = keyword.upper()
+            for action in _split_top_level(actions):
+                if keyword == 'SET':
+                    path, _, operand = action.partition('=')
+                    name = names.get(path.strip(), path.strip())
+                    item[name] = self._set_value(operand.strip(), item, names, values)
+                elif keyword == 'ADD':
+                    path, value = action.split()
+                    name, value = names.get(path, path), values[value]
+                    current = item.get(name)
+                    if current is None:
+                        item[name] = value
+                    elif 'N' in value:
+                        item[name] = _typed(_plain(current) + _plain(value), value)
+                    else:
+                        item[name] = _typed(_plain(current) | _plain(value), value)
+                elif keyword == 'REMOVE':
+                    name = names.get(action, action)
+                    item.pop(name, None)
+                else:
+                    path, value = action.split()
+                    name, value = names.get(path, path), values[value]
+                    if name in item:
+                        item[name] = _typed(_plain(item[name]) - _plain(value), value)
+                updated.append(name)
+        return updated
+
+    def _set_value(self, operand, item, names, values):
+        match = re.match(r"if_not_exists\s*\(\s*([^,\s]+)\s*,\s*([^)\s]+)\s*\)$", operand)
+        if match:
+            path = names.get(match.group(1), match.group(1))
+            return item[path] if path in item else values[match.group(2)]
+        for operator in ('+', '-'):
+            if operator in operand:
+                left, right = (self._set_value(part.strip(), item, names, values)
+                               for part in operand.split(operator, 1))
+                result = _plain(left) + _plain(right) if operator == '+' else _plain(left) - _plain(right)
+                return _typed(result, left)
+        if operand.startswith(':'):
+            return values[operand]
+        return item[names.get(operand, operand)]
+
+    def _page(self, table, items, request, key_names):
+        hash_key, range_key = key_names
+
+        def sort_key(item):
+            order = (_plain(item[range_key]),) if range_key and range_key in item else ()
+            return order + table.primary_key(item)
+
+        items.sort(key=sort_key)
+        if request.get('ScanIndexForward') is False:
+            items.reverse()
+        start = request.get('ExclusiveStartKey')
+        if start:
+            position = sort_key(start)
+            if request.get('ScanIndexForward') is False:
+                items = [item for item in items if sort_key(item) < position]
+            else:
+                items = [item for item in items if sort_key(item) > position]
+        limit = request.get('Limit')
+        last_evaluated_key = None
+        if limit and len(items) > limit:
+            items = items[:limit]
+            last = items[-1]
+            key_attributes = {table.hash_key, table.range_key, hash_key, range_key} - {None}
+            last_evaluated_key = {name: last[name] for name in key_attributes if name in last}
+        scanned = len(items)
+
+        names = request.get('ExpressionAttributeNames')
+        if request.get('FilterExpression'):
+            condition = _Parser(request['FilterExpression'], names,
+                                request.get('ExpressionAttributeValues')).condition()
+            items = [item for item in items if _evaluate(condition, item)]
+        response = {'Count': len(items), 'ScannedCount': scanned}
+        if request.get('Select') != 'COUNT':
+            response['Items'] = [_project(item, request.get('ProjectionExpression'), names) for item in items]
+        if last_evaluated_key:
+            response['LastEvaluatedKey'] = last_evaluated_key
+        return response
+
+    def Query(self, request):
+        table = self._table(request['TableName'])
+        key_names = table.key_names(request.get('IndexName'))
+        condition = _Parser(request['KeyConditionExpression'], request.get('ExpressionAttributeNames'),
+                            request.get('ExpressionAttributeValues')).condition()
+        hash_value = None
+        for node in _conjuncts(condition):
+            if node[0] == 'compare' and node[1] == '=' and node[2] == ('path', key_names[0]):
+                hash_value = _plain(node[3][1])
+        if hash_value is None:
+            raise ServiceError('ValidationException', "Query condition missed key schema element")
+        with table.lock:
+            if key_names[0] == table.hash_key:
+                candidates = table.items(hash_value)
+            else:
+                candidates = table.items()
+            items = [item for item in candidates if key_names[0] in item and _evaluate(condition, item)]
+        return self._page(table, items, request, key_names)
+
+    def Scan(self, request):
+        table = self._table(request['TableName'])
+        with table.lock:
+            items = table.items()
+        return self._page(table, items, request, (table.hash_key, None))
+
+    def BatchGetItem(self, request):
+        responses = {}
+        for table_name, options in request['RequestItems'].items():
+            table = self._table(table_name)
+            if len(options['Keys']) > 100:
+                raise ServiceError('ValidationException', "Too many items requested for the BatchGetItem call")
+            with table.lock:
+                items = [table.get(key) for key in options['Keys']]
+            responses[table_name] = [
+                _project(item, options.get('ProjectionExpression'), options.get('ExpressionAttributeNames'))
+                for item in items if item is not None
+            ]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def BatchWriteItem(self, request):
+        if sum(len(writes) for writes in request['RequestItems'].values()) > 25:
+            raise ServiceError('ValidationException', "Too many items requested for the BatchWriteItem call")
+        for table_name, writes in request['RequestItems'].items():
+            table = self._table(table_name)
+            with table.lock:
+                for write in writes:
+                    if 'PutRequest' in write:
+                        table.put(write['PutRequest']['Item'])
+                    else:
+                        table.delete(write['DeleteRequest']['Key'])
+        return {'UnprocessedItems': {}}
+
+    def TransactWriteItems(self, request):
+        actions = request['TransactItems']
+        if len(actions) > 25:
+            raise ServiceError('ValidationException', "Member must have length less than or equal to 25")
+        writes = []
+        for action in actions:
+            (kind, options), = action.items()
+            writes.append((kind, options, self._table(options['TableName'])))
+        # Locked in a fixed order, so concurrent transactions cannot deadlock.
+        tables = sorted({id(table): table for _, _, table in writes}.items())
+        for _, table in tables:
+            table.lock.acquire()
+        try:
+            reasons = []
+            for kind, options, table in writes:
+                try:
+                    self._check(options, table.get(options.get('Key') or options['Item']))
+                    reasons.append({'Code': 'None'})
+                except ServiceError:
+                    reasons.append({'Code': 'ConditionalCheckFailed', 'Message': "The conditional request failed"})
+            if any(reason['Code'] != 'None' for reason in reasons):
+                codes = ", ".join(reason['Code'] for reason in reasons)
+                raise ServiceError(
+                    'TransactionCanceledException',
+                    f"Transaction cancelled, please refer cancellation reasons for specific reasons [{codes}]",
+                    CancellationReasons=reasons)
+            for kind, options, table in writes:
+                if kind == 'Put':
+                    table.put(options['Item'])
+                elif kind == 'Delete':
+                    table.delete(options['Key'])
+                elif kind == 'Update':
+                    item = dict(table.get(options['Key']) or options['Key'])
+                    self._apply_update(item, options['UpdateExpression'],
+                                       options.get('ExpressionAttributeNames') or {},
+                                       options.get('ExpressionAttributeValues') or {})
+                    table.put(item)
+        finally:
+            for _, table in reversed(tables):
+                table.lock.release()
+        return {}
+
+
+# Rekognition
+
+class FakeRekognition:
+    """Face collections that recognise images by their bytes, see the module docstring."""
+
+    def __init__(self):
+        # collection id: OrderedDict of face id: (fingerprint, external image id)
+        self.collections = {}
+        self._lock = threading.Lock()
+
+    def _collection(self, collection_id):
+        try:
+            return self.collections[collection_id]
+        except KeyError:
+            raise ServiceError('ResourceNotFoundException', f"The collection id: {collection_id} does not exist")
+
+    @staticmethod
+    def _fingerprint(image):
+        return hashlib.sha1(base64.b64decode(image['Bytes'])).hexdigest()
+
+    @staticmethod
+    def _face(face_id, external_image_id=None):
+        face = {
+            'FaceId': face_id,
+            'BoundingBox': {'Width': 0.5, 'Height': 0.5, 'Left': 0.25, 'Top': 0.25},
+            'ImageId': str(uuid.uuid5(uuid.NAMESPACE_OID, face_id)),
+            'Confidence': 99.9,
+        }
+        if external_image_id:
+            face['ExternalImageId'] = external_image_id
+        return face
+
+    def add_face(self, collection_id, fingerprint, external_image_id=None):
+        face_id = str(uuid.uuid4())
+        with self._lock:
+            self.collections.setdefault(collection_id, collections.OrderedDict())[face_id] = (
+                fingerprint, external_image_id)
+        return face_id
+
+    def CreateCollection(self, request):
+        with self._lock:
+            if request['CollectionId'] in self.collections:
+                raise ServiceError('ResourceAlreadyExistsException',
+                                   f"The collection id: {request['CollectionId']} already exists")
+            self.collections[request['CollectionId']] = collections.OrderedDict()
+        return {'StatusCode': 200, 'CollectionArn': f"aws:rekognition:collection/{request['CollectionId']}",
+                'FaceModelVersion': '3.0'}
+
+    def DeleteCollection(self, request):
+        with self._lock:
+            self._collection(request['CollectionId'])
+            del self.collections[request['CollectionId']]
+        return {'StatusCode': 200}
+
+    def IndexFaces(self, request):
+        self._collection(request['CollectionId'])
+        external_image_id = request.get('ExternalImageId')
+        face_id = self.add_face(request['CollectionId'], self._fingerprint(request['Image']), external_image_id)
+        face = self._face(face_id, external_image_id)
+        return {
+            'FaceRecords': [{'Face': face, 'FaceDetail': {'BoundingBox': face['BoundingBox'], 'Confidence': 99.9}}],
+            'FaceModelVersion': '3.0',
+            'UnindexedFaces': [],
+        }
+
+    def SearchFacesByImage(self, request):
+        faces = self._collection(request['CollectionId'])
+        fingerprint = self._fingerprint(request['Image'])
+        with self._lock:
+            matches = [face_id for face_id, (face_fingerprint, _) in faces.items()
+                       if face_fingerprint == fingerprint]
+            if not matches and faces:
+                matches = [next(iter(faces))]
+            matches = [(face_id, faces[face_id][1]) for face_id in matches[:request.get('MaxFaces', 80)]]
+        return {
+            'SearchedFaceBoundingBox': {'Width': 0.5, 'Height': 0.5, 'Left': 0.25, 'Top': 0.25},
+            'SearchedFaceConfidence': 99.9,
+            'FaceMatches': [
+                {'Similarity': 99.0, 'Face': self._face(face_id, external_image_id)}
+                for face_id, external_image_id in matches
+            ],
+            'FaceModelVersion': '3.0',
+        }
+
+    def DetectFaces(self, request):
+        return {'FaceDetails': [
+            {'BoundingBox': {'Width': 0.5, 'Height': 0.5, 'Left': 0.25, 'Top': 0.25}, 'Confidence': 99.9}
+        ]}
+
+    def DeleteFaces(self, request):
+        faces = self._collection(request['CollectionId'])
+        with self._lock:
+            deleted = [face_id for face_id in request['FaceIds'] if faces.pop(face_id, None)]
+        return {'DeletedFaces': deleted}
+
+    def ListFaces(self, request):
+        faces = self._collection(request['CollectionId'])
+        with self._lock:
+            face_ids = list(faces.items())
+        start = int(request.get('NextToken') or 0)
+        end = start + request.get('MaxResults', 4096)
+        response = {'Faces': [self._face(face_id, external_image_id)
+                              for face_id, (_, external_image_id) in face_ids[start:end]],
+                    'FaceModelVersion': '3.0'}
+        if end < len(face_ids):
+            response['NextToken'] = str(end)
+        return response
+
+
+# Cognito Identity
+
+class FakeCognitoIdentity:
+    """Issues a stable identity per set of logins, and a new token per call."""
+
+    def GetOpenIdTokenForDeveloperIdentity(self, request):
+        logins = json.dumps(request['Logins'], sort_keys=True)
+        region = request['IdentityPoolId'].partition(':')[0]
+        identity_id = f"{region}:{uuid.uuid5(uuid.NAMESPACE_URL, logins)}"
+        return {'IdentityId': identity_id, 'Token': f"token.{uuid.uuid4().hex}"}
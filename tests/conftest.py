@@ -0,0 +1,40 @@
+"""Fixtures running the API against the in-memory AWS stand-ins of the benchmarks."""
+import os
+
+import pytest
+
+for name, value in {
+    'AWS_DEFAULT_REGION': 'eu-west-1',
+    'DEVICE_GROUP_TABLE': 'device-groups',
+    'DEVICE_GROUP_USERS_TABLE': 'device-group-users',
+    'DEVICE_GROUP_USER_FACES_TABLE': 'device-group-user-faces',
+    'DEVICE_GROUP_USERS_INTEGRATIONS_TABLE': 'device-group-users-integrations',
+    'INTEGRATIONS_TABLE': 'integrations',
+    'IDENTITY_POOL_ID': 'pool',
+    'DEVELOPER_PROVIDER_NAME': 'login.test',
+}.items():
+    os.environ.setdefault(name, value)
+
+from benchmarks.bench_api import Fixture, clear_caches  # noqa: E402
+from benchmarks.fake_aws import FakeAWS  # noqa: E402
+
+
+@pytest.fixture
+def fixture():
+    fake = FakeAWS()
+    fake.install()
+    clear_caches()
+    yield Fixture(fake)
+    clear_caches()
+
+
+@pytest.fixture
+def client():
+    from app.app import app
+
+    return app.test_client()
+
+
+def as_user(user_id):
+    """The `environ_base` of a request made by `user_id`."""
+    return {'event': {'requestContext': {'identity': {'cognitoIdentityId': user_id}}}}
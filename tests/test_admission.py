@@ -0,0 +1,105 @@
+import pytest
+from botocore.exceptions import ReadTimeoutError
+
+from app.managers.device_group import admission
+from tests.conftest import as_user
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """The in-memory store's clock, moved by hand."""
+
+    class Clock:
+        now = 1000.0
+
+        def __call__(self):
+            return self.now
+
+    clock = Clock()
+    monkeypatch.setattr(admission.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def budgets(monkeypatch):
+    monkeypatch.setattr(admission, 'ENABLED', True)
+    monkeypatch.setattr(admission, 'GROUP_BUDGET', admission.Budget(rate=5, burst=4))
+    monkeypatch.setattr(admission, 'DEVICE_BUDGET', admission.Budget(rate=1, burst=2))
+    monkeypatch.setattr(admission, '_store', admission.InMemoryRateLimitStore())
+
+
+def _admitted(group_id, device_id=None, cost=1):
+    try:
+        admission.admit(group_id, device_id, cost)
+        return True
+    except admission.AdmissionRejectedException:
+        return False
+
+
+def test_a_bucket_admits_its_burst_then_refills_at_its_rate(clock):
+    store = admission.InMemoryRateLimitStore()
+    budget = admission.Budget(rate=2, burst=3)
+
+    assert [store.acquire('key', budget, 1) for _ in range(3)] == [0, 0, 0]
+    assert store.acquire('key', budget, 1) == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert store.acquire('key', budget, 1) == 0
+    assert store.acquire('key', budget, 1) == pytest.approx(0.5)
+
+
+def test_a_refused_request_takes_no_tokens(clock):
+    store = admission.InMemoryRateLimitStore()
+    budget = admission.Budget(rate=1, burst=2)
+
+    assert store.acquire('key', budget, 2) == 0
+    assert store.acquire('key', budget, 2) == pytest.approx(2)
+    clock.now += 1
+    assert store.acquire('key', budget, 1) == 0
+
+
+def test_a_device_is_limited_on_its_own_budget(clock, budgets):
+    assert [_admitted('group', 'device') for _ in range(3)] == [True, True, False]
+    assert _admitted('group', 'other-device')
+
+
+def test_a_group_is_limited_across_its_devices_without_charging_them(clock, budgets):
+    assert [_admitted('group', f'device-{index}') for index in range(5)] == [True] * 4 + [False]
+    # The refused device kept its tokens.
+    assert [_admitted('other-group', 'device-4') for _ in range(3)] == [True, True, False]
+
+
+def test_the_cost_of_a_request_is_capped_at_the_burst(clock, budgets):
+    assert _admitted('group', cost=10)
+    assert not _admitted('group')
+
+
+def test_refusals_tell_when_to_retry(clock, budgets):
+    for _ in range(2):
+        admission.admit('group', 'device')
+    with pytest.raises(admission.AdmissionRejectedException) as refused:
+        admission.admit('group', 'device')
+    assert refused.value.retry_after == 1
+
+
+class _UnreachableStore(admission.RateLimitStore):
+    def acquire(self, key, budget, cost):
+        raise ReadTimeoutError(endpoint_url='https://dynamodb')
+
+    def release(self, key, budget, cost):
+        raise ReadTimeoutError(endpoint_url='https://dynamodb')
+
+
+def test_an_unreachable_store_admits_every_request(budgets, monkeypatch):
+    monkeypatch.setattr(admission, '_store', _UnreachableStore())
+    assert all(_admitted('group', 'device') for _ in range(10))
+
+
+def test_the_api_answers_refusals_with_retry_after(fixture, client, clock, budgets):
+    owner = fixture.user()
+    group_id = fixture.group(owner)
+    responses = [client.post(f'/api/groups/{group_id}/auth', environ_base=as_user(owner),
+                             json={'face': fixture.faces[0]}) for _ in range(3)]
+
+    assert [response.status_code for response in responses] == [201, 201, 429]
+    assert responses[-1].headers['Retry-After'] == '1'
@@ -0,0 +1,31 @@
+import pytest
+from botocore.config import Config
+
+from app.managers import aws, deadline
+from benchmarks.fake_aws import ServiceError
+
+
+@pytest.mark.parametrize('minimum, connect_timeout, read_timeout, attempts', aws.TIERS)
+def test_every_attempt_of_a_tier_fits_in_its_time(minimum, connect_timeout, read_timeout, attempts):
+    assert (connect_timeout + read_timeout) * attempts <= minimum - deadline.SAFETY_MARGIN
+
+
+def test_no_retry_is_attempted_after_the_deadline(fixture, monkeypatch):
+    fixture.fake.latency['dynamodb.GetItem'] = 0.3
+    attempts = []
+
+    def get_item(request):
+        attempts.append(request)
+        raise ServiceError('InternalServerError', "Try again.", status=500)
+
+    monkeypatch.setattr(fixture.fake.dynamodb, 'GetItem', get_item)
+    # Every tier retrying, whatever the time left.
+    monkeypatch.setattr(aws, '_configs', [Config(retries={'total_max_attempts': 3})] * len(aws.TIERS))
+    fixture.fake.install()
+    deadline.start(budget=deadline.SAFETY_MARGIN + 0.2)
+    try:
+        with pytest.raises(deadline.DeadlineExceededException):
+            aws.raw_client('dynamodb').get_item(TableName='device-groups', Key={'groupId': {'S': 'group'}})
+    finally:
+        deadline.clear()
+    assert len(attempts) == 1
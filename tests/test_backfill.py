@@ -0,0 +1,39 @@
+from app.managers.device_group import backfill, get_user_in_device_group
+from app.managers.device_group.device_group_manager import adjust_user_face_count, count_user_faces_in_group
+from tests.test_device_group_manager import _legacy_member
+
+
+def _add_face(fixture, group_id, user_id):
+    face_id = fixture.fake.rekognition.add_face(group_id, f"{user_id}/late", user_id)
+    fixture.tables['DEVICE_GROUP_USER_FACES_TABLE'].put(
+        {'groupId': {'S': group_id}, 'faceId': {'S': face_id}, 'userId': {'S': user_id}})
+
+
+def test_backfill_sets_the_missing_face_counts(fixture):
+    owner = fixture.user()
+    group_id = fixture.group(owner, members=2)
+    user_id = _legacy_member(fixture, group_id)
+    _add_face(fixture, group_id, user_id)
+
+    assert backfill.backfill_face_counts([group_id]) == 1
+    assert get_user_in_device_group(user_id, group_id).face_num == 1
+    assert get_user_in_device_group(owner, group_id).face_num == 3
+
+
+def test_backfill_recounts_when_faces_change_meanwhile(fixture, monkeypatch):
+    group_id = fixture.group(fixture.user())
+    user_id = _legacy_member(fixture, group_id)
+    counts = []
+
+    def count_then_register(user_id, group_id):
+        counts.append(count_user_faces_in_group(user_id, group_id))
+        if len(counts) == 1:
+            _add_face(fixture, group_id, user_id)
+            adjust_user_face_count(user_id, group_id, 1)
+        return counts[-1]
+
+    monkeypatch.setattr(backfill, 'count_user_faces_in_group', count_then_register)
+
+    assert backfill.backfill_face_counts([group_id]) == 1
+    assert counts == [0, 1]
+    assert get_user_in_device_group(user_id, group_id).face_num == 1
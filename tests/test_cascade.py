@@ -0,0 +1,46 @@
+import pytest
+
+from app.managers.device_group import cascade, delete_device_group, get_device_group, is_owner
+
+
+class _Lambda:
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, **kwargs):
+        self.invocations.append(kwargs)
+
+
+def _fail(group_id):
+    raise RuntimeError("DynamoDB is unavailable.")
+
+
+def test_a_group_whose_rows_cannot_be_deleted_can_be_deleted_again(fixture, monkeypatch):
+    owner = fixture.user()
+    group_id = fixture.group(owner, members=2)
+    monkeypatch.delenv('CASCADE_DELETE_FUNCTION', raising=False)
+    monkeypatch.setattr(cascade, 'delete_dependents', _fail)
+
+    with pytest.raises(RuntimeError):
+        delete_device_group(group_id)
+
+    assert get_device_group(group_id).id == group_id
+    assert is_owner(owner, group_id)
+    assert group_id in fixture.fake.rekognition.collections
+
+    monkeypatch.undo()
+    assert delete_device_group(group_id) is True
+    assert cascade.count_dependents(group_id, 100) == 0
+    assert group_id not in fixture.fake.rekognition.collections
+
+
+def test_rows_that_cannot_be_deleted_now_are_deleted_in_the_background(fixture, monkeypatch):
+    group_id = fixture.group(fixture.user(), members=2)
+    function = _Lambda()
+    monkeypatch.setenv('CASCADE_DELETE_FUNCTION', 'cascade-delete')
+    monkeypatch.setattr(cascade.aws, 'client', lambda service_name: function)
+    monkeypatch.setattr(cascade, 'delete_dependents', _fail)
+
+    assert delete_device_group(group_id) is False
+    assert [invocation['FunctionName'] for invocation in function.invocations] == ['cascade-delete']
+    assert group_id not in fixture.fake.rekognition.collections
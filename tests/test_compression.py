@@ -0,0 +1,38 @@
+import gzip
+
+import pytest
+
+from tests.conftest import as_user
+
+
+@pytest.fixture
+def groups(fixture, client):
+    """Gets the groups of an owner of enough groups for them to be compressed."""
+    owner = fixture.user()
+    for _ in range(20):
+        fixture.group(owner, faces=0)
+    return lambda **headers: client.get('/api/groups', environ_base=as_user(owner), headers=headers)
+
+
+def test_a_compressed_response_has_a_weak_etag(groups):
+    identity = groups()
+    compressed = groups(**{'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in identity.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.data) == identity.data
+    assert compressed.headers['ETag'] == 'W/' + identity.headers['ETag']
+
+
+def test_each_representation_is_revalidated_with_its_own_etag(groups):
+    identity = groups()
+    compressed = groups(**{'Accept-Encoding': 'gzip'})
+
+    not_modified = groups(**{'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']})
+    assert not_modified.status_code == 304
+    assert not_modified.headers['ETag'] == compressed.headers['ETag']
+
+    not_modified = groups(**{'If-None-Match': identity.headers['ETag']})
+    assert not_modified.status_code == 304
+    assert not_modified.headers['ETag'] == identity.headers['ETag']
@@ -0,0 +1,17 @@
+import pytest
+
+from tests.conftest import as_user
+
+
+@pytest.mark.parametrize('query, multi', [
+    ('', False), ('?multi=false', False), ('?multi=0', False), ('?multi=true', True), ('?multi=1', True),
+])
+def test_auth_only_authenticates_every_face_when_asked_to(fixture, client, query, multi):
+    owner = fixture.user()
+    group_id = fixture.group(owner)
+
+    response = client.post(f'/api/groups/{group_id}/auth{query}', environ_base=as_user(owner),
+                           json={'face': fixture.faces[0]})
+
+    assert response.status_code == 201
+    assert ('users' in response.get_json()) is multi
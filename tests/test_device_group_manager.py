@@ -0,0 +1,119 @@
+import pytest
+from botocore.exceptions import EndpointConnectionError, ReadTimeoutError
+
+from app.managers.device_group import (
+    adjust_user_face_count,
+    get_user_in_device_group,
+    get_users_in_device_group_page,
+)
+from tests.conftest import as_user
+
+
+def _legacy_member(fixture, group_id):
+    # Rows written before the face counter and the version existed.
+    user_id = fixture.user()
+    fixture.tables['DEVICE_GROUP_USERS_TABLE'].put({
+        'groupId': {'S': group_id}, 'userId': {'S': user_id}, 'groupOwner': {'BOOL': False}})
+    return user_id
+
+
+def test_adjust_user_face_count_bumps_the_version_of_legacy_rows(fixture):
+    group_id = fixture.group(fixture.user())
+    user_id = _legacy_member(fixture, group_id)
+
+    adjust_user_face_count(user_id, group_id, 3)
+
+    user = get_user_in_device_group(user_id, group_id)
+    assert user.version == 1
+    assert user.face_num == 0
+
+
+def test_registering_faces_changes_the_etag_of_a_legacy_user(fixture, client):
+    group_id = fixture.group(fixture.user())
+    user_id = _legacy_member(fixture, group_id)
+    path = f'/api/groups/{group_id}/users/{user_id}'
+
+    response = client.get(path, environ_base=as_user(user_id))
+    etag = response.headers['ETag']
+    assert response.get_json()['faceNum'] == 0
+
+    response = client.post(f'{path}/faces', environ_base=as_user(user_id),
+                           json={'faces': fixture.faces, 'provider': 'login.bench', 'token': user_id})
+    assert response.status_code == 201
+
+    response = client.get(path, environ_base=as_user(user_id), headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['faceNum'] == 3
+
+
+def test_listing_counts_the_faces_of_legacy_users_page_by_page(fixture, monkeypatch):
+    from app.managers.device_group import device_group_manager
+
+    group_id = fixture.group(fixture.user(), members=5)
+    legacy = {_legacy_member(fixture, group_id) for _ in range(4)}
+    for user_id in legacy:
+        fixture.member(group_id, user_id)
+        fixture.tables['DEVICE_GROUP_USERS_TABLE'].put({
+            'groupId': {'S': group_id}, 'userId': {'S': user_id}, 'groupOwner': {'BOOL': False}})
+    ranges = []
+    count_faces_by_user = device_group_manager._count_faces_by_user
+    monkeypatch.setattr(device_group_manager, '_count_faces_by_user',
+                        lambda *args: ranges.append(args[1:]) or count_faces_by_user(*args))
+
+    users, cursor = [], None
+    while True:
+        page, cursor = get_users_in_device_group_page(group_id, limit=3, cursor=cursor)
+        users.extend(page)
+        if cursor is None:
+            break
+
+    assert len(users) == 10
+    assert all(user.face_num == 3 for user in users)
+    # Only the faces of the users of a page are read, never the whole group.
+    assert ranges
+    for first, last in ranges:
+        assert len([user for user in users if first <= user.id <= last]) <= 3
+
+
+class _FailingClient:
+    """Delegates to a client, raising `error` from one of its operations."""
+
+    def __init__(self, client, operation, error):
+        self._client = client
+        self._operation = operation
+        self._error = error
+
+    def __getattr__(self, name):
+        if name == self._operation:
+            def fail(**kwargs):
+                raise self._error
+            return fail
+        return getattr(self._client, name)
+
+
+def test_create_device_group_deletes_the_collection_when_the_transaction_times_out(fixture, monkeypatch):
+    from app.managers.device_group import device_group_manager
+
+    monkeypatch.setattr(device_group_manager, 'dynamodb_client', _FailingClient(
+        device_group_manager.dynamodb_client, 'transact_write_items',
+        ReadTimeoutError(endpoint_url='https://dynamodb')))
+
+    with pytest.raises(ReadTimeoutError):
+        device_group_manager.create_device_group('Timeout', fixture.user())
+
+    assert fixture.fake.rekognition.collections == {}
+
+
+def test_create_device_group_rolls_back_the_group_when_the_collection_cannot_be_reached(fixture, monkeypatch):
+    from app.managers.device_group import device_group_manager
+
+    owner = fixture.user()
+    monkeypatch.setattr(device_group_manager, 'rekognition', _FailingClient(
+        device_group_manager.rekognition, 'create_collection',
+        EndpointConnectionError(endpoint_url='https://rekognition')))
+
+    with pytest.raises(EndpointConnectionError):
+        device_group_manager.create_device_group('Unreachable', owner)
+
+    assert device_group_manager.get_device_groups_by_user(owner) == []
@@ -0,0 +1,60 @@
+# shared dispatcher for third party integration handlers
+#
+# An integration handler receives either a single event:
+#
+#     {'context': 'widget', 'userId': ..., 'groupId': ..., 'params': {...}}
+#
+# and returns the result of its handler for that context, or a batch event:
+#
+#     {'tasks': [{'context': 'widget', 'userId': ..., ...}, ...]}
+#
+# and returns {'results': [...]} with one result per task, in the same order.
+# A task result is {'status': 'ok', 'data': ...} or {'status': 'error', 'error': ...}
+# so that one failing task does not fail the whole batch.
+
+
+class Batch:
+    """State shared by the tasks of one invocation."""
+
+    def __init__(self):
+        self._shared = {}
+
+    def shared(self, key, fetch):
+        """Fetch something once per batch, e.g. one weather lookup per location."""
+        if key not in self._shared:
+            self._shared[key] = fetch()
+        return self._shared[key]
+
+
+class UnknownContextException(Exception):
+    pass
+
+
+def _run(handlers, task, batch):
+    context = task.get('context')
+    if context not in handlers:
+        raise UnknownContextException(f"Unknown context '{context}'.")
+    return handlers[context](task, batch)
+
+
+def dispatch(handlers, event):
+    """Run a single or batch event against handlers keyed by context.
+
+    Parameters
+    ----------
+    handlers: Dict[str, Callable[[dict, Batch], object]]
+        The handler of each context ('info', 'menu', 'app', 'widget').
+    event: dict
+        A single event, or a batch event with a list of `tasks`.
+    """
+    batch = Batch()
+    if 'tasks' not in event:
+        return _run(handlers, event, batch)
+
+    results = []
+    for task in event['tasks']:
+        try:
+            results.append({'status': 'ok', 'data': _run(handlers, task, batch)})
+        except Exception as e:
+            results.append({'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+    return {'results': results}
@@ -1,36 +1,53 @@
 # simple example lambda script that could be used for third party integration
+from .dispatch import dispatch
 
 
 def weather_handler(event, env):
-    context = event['context']
+    return dispatch(HANDLERS, event)
 
-    if context == 'info':
-        weather_info_handler(event)
-    elif context == 'menu':
-        weather_menu_handler(event)
-    elif context == 'app':
-        weather_app_handler(event)
-    elif context == 'widget':
-        weather_widget_handler(event)
 
+def fetch_weather(location):
+    # stands in for the upstream weather service, called once per location per batch
+    return {
+        'location': location,
+        'temperature': 5,
+        'summary': 'Sunny',
+        'icon': 'sunny'
+    }
+
+
+def get_weather(event, batch):
+    location = (event.get('params') or {}).get('location', 'Limerick')
+    return batch.shared(('weather', location), lambda: fetch_weather(location))
 
-def weather_info_handler(event):
+
+def weather_info_handler(event, batch):
     ...
 
 
-def weather_menu_handler(event):
+def weather_menu_handler(event, batch):
     ...
 
 
-def weather_app_handler(event):
+def weather_app_handler(event, batch):
     ...
 
 
-def weather_widget_handler(event):
+def weather_widget_handler(event, batch):
+    weather = get_weather(event, batch)
     return {
         'title': 'Weather',
-        'icon': 'sunny',
-        'secondaryText': '5°C Sunny',
-        'tertiaryText': 'Limerick',
-        'template': 'circle'
+        'icon': weather['icon'],
+        'secondaryText': f"{weather['temperature']}°C {weather['summary']}",
+        'tertiaryText': weather['location'],
+        'template': 'circle',
+        'ttl': 600
     }
+
+
+HANDLERS = {
+    'info': weather_info_handler,
+    'menu': weather_menu_handler,
+    'app': weather_app_handler,
+    'widget': weather_widget_handler,
+}